@@ -0,0 +1,119 @@
+"""
+Anytime optimization: run the branch and bound search under a time or state
+budget and report the best sequences found so far, whether the search finished,
+and the upper bound it proved on best_net. Improved incumbents are reported as
+they are found, and a Budget can be cancelled from another thread or by
+cancelling the asyncio task awaiting anytime_search_async.
+"""
+import sys
+import time
+import asyncio
+import argparse
+import threading
+from functools import partial
+from config import AVAILABLE_LEVELS, TRANSITIONS_FILE
+from rules import base_products, products
+from branch_bound import BranchBoundSearch
+from frontier import find_best_sequences_by_layer
+from precompute import get_product_bitmap
+from transitions import get_transition_table
+
+# Longest sequences the default engine searches to seed the incumbents; at the
+# default max_length it takes about a second with every product.
+SEED_MAX_LENGTH = 9
+
+class Budget:
+    """Stop condition shared with the search: a deadline, a cap on popped states, or cancel()."""
+    def __init__(self, seconds=None, states=None):
+        self.seconds = seconds
+        self.deadline = None if seconds is None else time.monotonic() + seconds
+        self.states = states
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def exhausted(self, states):
+        return (self.cancelled.is_set()
+                or (self.states is not None and states >= self.states)
+                or (self.deadline is not None and time.monotonic() >= self.deadline))
+
+def snapshot(search):
+    """The search's best-so-far result, with "complete", "bound" and "states" added."""
+    result = search.result()
+    result["complete"] = search.complete
+    result["bound"] = search.bound()
+    result["states"] = search.popped
+    return result
+
+def iter_anytime(base, supplemental_products, max_length=9, max_effects=8, budget=None, table=None):
+    """
+    Yield a snapshot of the default engine's results up to SEED_MAX_LENGTH, which
+    seed the search's incumbents, then one every time best_net improves, then a
+    final snapshot once the search completes or the budget runs out. Each
+    snapshot's "bound" is a proved upper bound on best_net over all sequences; it
+    equals best_net["net_benefit"] when "complete" is True. Only stored suffix
+    tables are used (`python deep.py` stores them); without them the search bounds
+    every label by the multiplier cap, so the budget covers all of its work.
+    """
+    budget = budget or Budget()
+    search = BranchBoundSearch(base, supplemental_products, max_length, max_effects, table, build=False)
+    seeds = find_best_sequences_by_layer(base, supplemental_products, min(max_length, SEED_MAX_LENGTH), max_effects, search.table)
+    for combo in [seeds["best_net"], seeds["best_value"], *seeds["by_length"].values()]:
+        search.seed(combo["sequence"])
+    yield snapshot(search)
+    for _ in search.steps(budget.exhausted):
+        yield snapshot(search)
+    yield snapshot(search)
+
+def anytime_search(base, supplemental_products, max_length=9, max_effects=8, budget=None, table=None, on_improvement=None):
+    """Final snapshot of iter_anytime; on_improvement, if given, sees every earlier one."""
+    result = None
+    for snap in iter_anytime(base, supplemental_products, max_length, max_effects, budget, table):
+        if on_improvement is not None and result is not None:
+            on_improvement(result)
+        result = snap
+    return result
+
+async def anytime_search_async(base, supplemental_products, max_length=9, max_effects=8, budget=None, table=None, on_improvement=None):
+    """
+    anytime_search on a worker thread. on_improvement is called on the event loop.
+    Cancelling the awaiting task cancels the budget, so the search stops at its
+    next pop rather than running on in the background.
+    """
+    budget = budget or Budget()
+    loop = asyncio.get_running_loop()
+    callback = None if on_improvement is None else partial(loop.call_soon_threadsafe, on_improvement)
+    future = loop.run_in_executor(None, partial(anytime_search, base, supplemental_products, max_length, max_effects, budget, table, callback))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        budget.cancel()
+        raise
+
+def print_improvement(result):
+    best = result["best_net"]
+    print(f'{result["states"]:>9} states  net {best["net_benefit"]:8.2f}  bound {result["bound"]:8.2f}  {" + ".join(best["sequence"])}', flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Best sequences for one base within a time or state budget.")
+    parser.add_argument("base", choices=[bp.name for bp in base_products])
+    parser.add_argument("--level", default=AVAILABLE_LEVELS[-1], choices=AVAILABLE_LEVELS)
+    parser.add_argument("--max-length", type=int, default=9)
+    parser.add_argument("--max-effects", type=int, default=8)
+    parser.add_argument("--seconds", type=float, help="wall time budget")
+    parser.add_argument("--states", type=int, help="popped state budget")
+    args = parser.parse_args(argv)
+
+    bitmap = get_product_bitmap(args.level)
+    base = next(bp for bp in base_products if bp.name == args.base)
+    allowed = [p for i, p in enumerate(products) if (bitmap >> i) & 1]
+    table = get_transition_table(TRANSITIONS_FILE)
+    budget = Budget(args.seconds, args.states)
+    result = anytime_search(base, allowed, args.max_length, args.max_effects, budget, table, on_improvement=print_improvement)
+    print_improvement(result)
+    print("complete" if result["complete"] else "budget exhausted; best_net is within the bound above")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
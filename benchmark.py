@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+from config import AVAILABLE_LEVELS, TRANSITIONS_FILE, BENCHMARK_FILE, BENCHMARK_BASELINE_FILE
+from rules import base_products
+from optimizer import get_optimal_combo_for_bitmap
+from precompute import get_product_bitmap, precompute_all
+from transitions import get_transition_table
+from instrumentation import collect
+
+BASES = ["OG Kush", "Meth", "Cocaine"]
+MAX_LENGTHS = [6, 8]
+MAX_EFFECTS = [6, 8]
+# branch_bound is left out by default: every case it runs builds suffix tables
+# for its own base, level, max_length and max_effects first.
+ENGINES = ["frontier"]
+
+def benchmark_levels():
+    """The first level of the first, middle and last distinct unlock sets."""
+    first_level = {}
+    for level in AVAILABLE_LEVELS:
+        first_level.setdefault(get_product_bitmap(level), level)
+    levels = list(first_level.values())
+    return [levels[0], levels[len(levels) // 2], levels[-1]]
+
+def benchmark_matrix():
+    """The fixed (base, level, max_length, max_effects) cases every run measures."""
+    return [
+        {"base": base, "level": level, "bitmap": get_product_bitmap(level), "max_length": max_length, "max_effects": max_effects}
+        for base in BASES for level in benchmark_levels() for max_length in MAX_LENGTHS for max_effects in MAX_EFFECTS
+    ]
+
+def digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+def run_case(case, engine, memory=True, repeat=3):
+    """
+    Time one optimizer call on a warm transition table, keeping the fastest of
+    `repeat` runs. The table is warmed by an untimed call first, so runs measure the
+    search rather than filling the table (or, for branch_bound, building the suffix
+    tables). Peak memory comes from a separate traced call, since tracing slows
+    the search.
+    """
+    base = next(bp for bp in base_products if bp.name == case["base"])
+    args = (base, case["bitmap"], case["max_length"], case["max_effects"], engine)
+    get_optimal_combo_for_bitmap(*args)
+    seconds = None
+    for _ in range(repeat):
+        with collect() as counts:
+            start = time.perf_counter()
+            result = get_optimal_combo_for_bitmap(*args)
+            elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    measured = dict(case, engine=engine, seconds=seconds, states=counts["states_popped"],
+                    states_per_second=counts["states_popped"] / seconds if seconds else None,
+                    result=digest({key: result[key] for key in ("best_net", "best_value", "by_length")}))
+    if memory:
+        tracemalloc.start()
+        get_optimal_combo_for_bitmap(*args)
+        measured["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return measured
+
+def run_precompute(workers=None):
+    """Time a full precompute_all in a scratch directory, reusing the saved transition table."""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        if os.path.exists(TRANSITIONS_FILE):
+            shutil.copy(TRANSITIONS_FILE, scratch)
+        os.chdir(scratch)
+        try:
+            start = time.perf_counter()
+            precomputed = precompute_all(workers=workers, progress=None)
+            seconds = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    return {"case": "precompute_all", "workers": workers, "seconds": seconds, "result": digest(precomputed)}
+
+def case_key(measured):
+    if "case" in measured:
+        return measured["case"]
+    return f'{measured["engine"]}/{measured["base"]}/{measured["bitmap"]:#x}/L{measured["max_length"]}/E{measured["max_effects"]}'
+
+def compare(run, baseline, threshold, min_seconds=0.05):
+    """
+    Flag every case whose result digest changed, or whose wall time or peak memory
+    grew more than threshold (a fraction) over the baseline's. Wall times under
+    min_seconds are too noisy to flag.
+    """
+    previous = {case_key(m): m for m in baseline["cases"]}
+    flags = []
+    for measured in run["cases"]:
+        key = case_key(measured)
+        old = previous.get(key)
+        if old is None:
+            continue
+        if measured["result"] != old["result"]:
+            flags.append({"case": key, "kind": "result changed"})
+        for metric in ("seconds", "peak_memory"):
+            if metric == "seconds" and measured["seconds"] < min_seconds:
+                continue
+            if old.get(metric) and measured.get(metric) and measured[metric] > old[metric] * (1 + threshold):
+                flags.append({"case": key, "kind": f"{metric} regression", "baseline": old[metric], "current": measured[metric]})
+    return flags
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the optimizer over a fixed matrix of cases.")
+    parser.add_argument("--engine", action="append", help="engine to measure (repeatable, default frontier)")
+    parser.add_argument("--output", default=BENCHMARK_FILE)
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown / memory growth before flagging")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, fastest kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak memory pass")
+    parser.add_argument("--precompute", action="store_true", help="also time a full precompute_all")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(argv)
+
+    get_transition_table(TRANSITIONS_FILE)
+    cases = []
+    for engine in args.engine or ENGINES:
+        for case in benchmark_matrix():
+            measured = run_case(case, engine, memory=not args.no_memory, repeat=args.repeat)
+            cases.append(measured)
+            print(f'{case_key(measured)}: {measured["seconds"]:.3f}s {measured["states"]} states', flush=True)
+    if args.precompute:
+        measured = run_precompute(args.workers)
+        cases.append(measured)
+        print(f'precompute_all: {measured["seconds"]:.1f}s', flush=True)
+    run = {"python": sys.version.split()[0], "cases": cases}
+
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            run["flags"] = compare(run, json.load(f), args.threshold)
+        for flag in run["flags"]:
+            print("REGRESSION" if "regression" in flag["kind"] else "CHANGED", flag["case"], flag["kind"])
+    with open(args.output, "w") as f:
+        json.dump(run, f, indent=1)
+    if args.save_baseline:
+        shutil.copy(args.output, args.baseline)
+    return 1 if run.get("flags") else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
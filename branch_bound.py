@@ -0,0 +1,211 @@
+import heapq
+import math
+from collections import Counter
+from frontier import make_candidate
+from products import multiplier_cap
+from reducers import CandidateReducer
+from instrumentation import record, record_cache
+from transitions import get_transition_table
+from deep import get_suffix_tables, at
+
+class BranchBoundSearch:
+    """
+    Best-first branch and bound over the same sequence space as the BFS engines
+    (no immediate repeats, effect cap, fewer than three multiplier drops), without
+    the delta_max heuristic, bounded by the base's SuffixTables (see deep.py). A
+    label is kept while an extension of it might still improve a field of the
+    result: best_net, best_value, or by_length at a length it can still reach.
+    Labels with the same (state, last product, drops, length) are dominated by the
+    cheapest. Labels are popped in order of their bound on net benefit; once the
+    heap is empty every field is optimal. Tables of depth max_length - 1 are
+    enough (see deep.py), so any max_length works.
+
+    The search can be stopped and resumed between pops (see steps), and bound()
+    is a proved upper bound on the best net benefit at any point. With
+    build=False, missing suffix tables are not built and the search bounds every
+    label by the multiplier cap instead, which is admissible but loose.
+    """
+    def __init__(self, base, supplemental_products, max_length=9, max_effects=8, table=None, suffix_tables=None, build=True):
+        if table is None:
+            table = get_transition_table()
+        self.base = base
+        self.supplemental_products = supplemental_products
+        self.max_length = max_length
+        self.max_effects = max_effects
+        self.table = table
+        self.columns = [table.product_index[p.name] for p in supplemental_products]
+        self.prices = [p.price for p in supplemental_products]
+        self.cap = base.price * multiplier_cap(max_effects)
+        if suffix_tables is None:
+            suffix_tables = get_suffix_tables(table, base, supplemental_products, max_effects, max_length, build=build)
+        elif not suffix_tables.serves(max_length):
+            raise ValueError(f"suffix tables of depth {suffix_tables.depth} do not serve max_length {max_length}")
+        self.suffix_tables = suffix_tables
+        self.suffix_columns = {}
+        root = table.initial_state(base)
+        self.sids, self.costs, self.lengths, self.drops, self.lasts, self.parents = [root], [0], [1], [0], [-1], [-1]
+        self.cheapest = {}
+        self.reducer = CandidateReducer()
+        self.evaluate(0)
+        self.heap = [(-self.upper_bound(root, 0, 1), 0)] if max_length > 1 and self.needed(root, 0, 1) else []
+        self.popped = 0
+        self.complete = False
+
+    def suffix(self, sid):
+        """
+        The suffix tables' column at sid (see SuffixTables.column), the cap outside
+        them, with rebated replaced by exact: exact[m] bounds the net after exactly
+        m more mixes, for m below max_length.
+        """
+        column = self.suffix_columns.get(sid)
+        if column is None:
+            if self.suffix_tables is not None:
+                column = self.suffix_tables.column(self.table.masks[sid])
+            if column is None:
+                column = [self.cap], [0], [self.cap], [0], self.cap
+            values, steps, peaks, peak_steps, rebated = column
+            rebate = 0 if self.suffix_tables is None else self.suffix_tables.rebate
+            exact = [min(at(values, steps, mixes), rebated - rebate * mixes) for mixes in range(self.max_length)]
+            column = self.suffix_columns[sid] = values, steps, peaks, peak_steps, exact
+        return column
+
+    def upper_bound(self, sid, cost, length):
+        """Admissible bound on the net benefit of any extension of a label at sid."""
+        values, steps = self.suffix(sid)[:2]
+        return at(values, steps, self.max_length - length) - cost
+
+    def needed(self, sid, cost, length):
+        """Whether some extension of a label at sid could beat best_value or by_length at some length."""
+        values, steps, peaks, peak_steps, exact = self.suffix(sid)
+        by_length = self.reducer.by_length
+        for target in range(length + 1, self.max_length + 1):
+            heap = by_length.get(target)
+            if not heap or exact[target - length] - cost > heap[0][0]:
+                return True
+        # best_value: a higher value wins outright; an equal one only if cheaper,
+        # and reaching it costs at least the multiplier it needs minus the suffix bound.
+        (value, cheapest), _ = self.reducer.best_value
+        remaining = self.max_length - length
+        reachable = math.ceil(self.base.price + at(peaks, peak_steps, remaining))
+        if reachable != value:
+            return reachable > value
+        return cost + max(0, value - 1 - self.base.price - at(values, steps, remaining)) < -cheapest
+
+    def seed(self, sequence):
+        """
+        Add the labels along a known sequence (base name first, as in results) as
+        incumbents. They are not pushed: the search still reaches the same
+        sequences through its own labels, so seeding only prunes sooner.
+        """
+        index = {p.name: i for i, p in enumerate(self.supplemental_products)}
+        label = 0
+        for name in sequence[1:]:
+            i = index[name]
+            sid = self.sids[label]
+            new_sid = int(self.table.expand(sid)[self.columns[i]])
+            drop = self.drops[label] + (self.table.multiplier.item(new_sid) < self.table.multiplier.item(sid))
+            self.sids.append(new_sid)
+            self.costs.append(self.costs[label] + self.prices[i])
+            self.lengths.append(self.lengths[label] + 1)
+            self.drops.append(drop)
+            self.lasts.append(i)
+            self.parents.append(label)
+            label = len(self.sids) - 1
+            self.evaluate(label)
+
+    def evaluate(self, label):
+        multiplier = self.table.multiplier.item(self.sids[label])
+        cost = self.costs[label]
+        self.reducer.add(label, self.lengths[label], self.base.price * multiplier - cost, math.ceil(self.base.price * (1 + multiplier)), cost)
+
+    def bound(self):
+        """Upper bound on the best net benefit of any sequence, explored or not."""
+        best = self.reducer.best_net[0]
+        return best if self.complete or not self.heap else max(best, -self.heap[0][0])
+
+    def steps(self, stop=None):
+        """
+        Run the search, yielding after every pop that improved best_net. stop(popped)
+        is checked before each pop; when it returns True the generator ends with the
+        search left resumable. self.complete tells whether it ran to the end.
+        """
+        table, columns, prices = self.table, self.columns, self.prices
+        sids, costs, lengths, drops, lasts, parents = self.sids, self.costs, self.lengths, self.drops, self.lasts, self.parents
+        max_length, max_effects, reducer, heap, cheapest = self.max_length, self.max_effects, self.reducer, self.heap, self.cheapest
+        cache = table.hits, table.misses
+        counts = Counter()
+        try:
+            while heap:
+                if stop is not None and stop(self.popped):
+                    return
+                _, label = heapq.heappop(heap)
+                sid, cost, length, drop, last = sids[label], costs[label], lengths[label], drops[label], lasts[label]
+                # Incumbents may have improved since the push.
+                if not self.needed(sid, cost, length):
+                    counts["pruned_bound"] += 1
+                    continue
+                self.popped += 1
+                counts["states_popped"] += 1
+                incumbent = reducer.best_net[1]
+                multiplier = table.multiplier.item(sid)
+                row = table.expand(sid).tolist()
+                for i, column in enumerate(columns):
+                    if i == last:
+                        continue
+                    new_sid = row[column]
+                    if table.effect_count[new_sid] > max_effects:
+                        counts["pruned_effect_cap"] += 1
+                        continue
+                    new_drop = drop + 1 if table.multiplier.item(new_sid) < multiplier else drop
+                    if new_drop >= 3:
+                        counts["pruned_drop"] += 1
+                        continue
+                    new_cost = cost + prices[i]
+                    key = (new_sid, i, new_drop, length + 1)
+                    if cheapest.get(key, math.inf) <= new_cost:
+                        counts["pruned_visited"] += 1
+                        continue
+                    cheapest[key] = new_cost
+                    child = len(sids)
+                    sids.append(new_sid)
+                    costs.append(new_cost)
+                    lengths.append(length + 1)
+                    drops.append(new_drop)
+                    lasts.append(i)
+                    parents.append(label)
+                    self.evaluate(child)
+                    if length + 1 >= max_length:
+                        counts["pruned_length"] += 1
+                        continue
+                    if table.effect_count[new_sid] >= max_effects:
+                        counts["pruned_effect_cap"] += 1
+                        continue
+                    if not self.needed(new_sid, new_cost, length + 1):
+                        counts["pruned_bound"] += 1
+                        continue
+                    counts["states_pushed"] += 1
+                    heapq.heappush(heap, (-self.upper_bound(new_sid, new_cost, length + 1), child))
+                if reducer.best_net[1] != incumbent:
+                    yield self
+            self.complete = True
+        finally:
+            record(**counts)
+            record_cache(table, cache)
+
+    def candidate(self, label):
+        names = []
+        node = label
+        while self.parents[node] >= 0:
+            names.append(self.supplemental_products[self.lasts[node]].name)
+            node = self.parents[node]
+        return make_candidate(self.base, [self.base.name] + names[::-1], self.table, self.sids[label], self.costs[label])
+
+    def result(self):
+        return self.reducer.result(self.candidate)
+
+def find_best_sequences_branch_bound(base, supplemental_products, max_length=9, max_effects=8, table=None):
+    """Run a BranchBoundSearch to completion; best_net, best_value and by_length are all optimal."""
+    search = BranchBoundSearch(base, supplemental_products, max_length, max_effects, table)
+    for _ in search.steps():
+        pass
+    return search.result()
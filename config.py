@@ -51,4 +51,18 @@ multipliers = {
 
 # Filenames for outputs and precomputed results
 PRECOMPUTED_FILE = "precomputed_results.json"
+PRECOMPUTED_BINARY_FILE = "precomputed_results.bin"
 OUTPUT_HTML_FILE = "index.html"
+OUTPUT_DATA_DIR = "data"
+TRANSITIONS_FILE = "transitions.npz"
+GAME_DATA_FILE = "game_data.json"
+STATE_GRAPH_FILE = "state_graph.bin"
+TIMING_REPORT_FILE = "timing_report.json"
+PRECOMPUTE_CACHE_DIR = "precompute_cache"
+SUFFIX_CACHE_DIR = "suffix_cache"
+REACH_CACHE_DIR = "reach_cache"
+# Disk space the stored tables may take before the least recently used are removed
+SUFFIX_CACHE_MAX_BYTES = 2 << 30
+REACH_CACHE_MAX_BYTES = 1 << 30
+BENCHMARK_FILE = "benchmark_results.json"
+BENCHMARK_BASELINE_FILE = "benchmark_baseline.json"
@@ -0,0 +1,248 @@
+"""
+Suffix tables: the bounds behind the branch and bound engine (branch_bound.py),
+which let it search long mixing sequences (max_length 12-20 and beyond) once the
+tables exist.
+
+The mask graph is finite: everything reachable from a base through a product set
+is one closure (about eleven million masks with all products), whatever the
+sequence length. SuffixTables runs relaxed DPs over the part of that closure
+within `depth` mixes of the base (all of it if depth is None), ignoring the
+multiplier-drop rule but keeping no-immediate-repeat and the effect cap:
+suffix[r] of a mask is the best price * multiplier - cost over at most r further
+mixes from it, and peak[r] the best price * multiplier alone. A third DP runs
+with every price lowered by the rebate, the cheapest product's price: its last
+value minus rebate * r bounds the net over exactly r further mixes, which is
+what keeps by_length cheap past the best length. All of them bound every label
+at that mask from above, since dropping rules only adds sequences. A label of
+length l never has more than max_length - l mixes left, and every mask those
+mixes pass through is within max_length - 1 of the base, so tables of depth
+max_length - 1 serve max_length and below, and whole-closure tables serve every
+length.
+
+Tables are kept in SUFFIX_CACHE_DIR under their suffix_key (see
+mapped_file.load_or_build); `python deep.py` builds them ahead of time for every
+base at the rules' prices. With all products, depth 8 (max_length 9) covers
+about 1.8 million masks; the whole closure takes about eight minutes and 4GB
+per base. Past max_length 12 or so the tables cover nearly the whole closure,
+and even with them stored an exact search over all products takes half a
+minute at max_length 16 and minutes at 20; anytime.py gives long searches a
+deadline instead.
+"""
+import sys
+import argparse
+import numpy as np
+from config import AVAILABLE_LEVELS, SUFFIX_CACHE_DIR, SUFFIX_CACHE_MAX_BYTES, TRANSITIONS_FILE
+from rules import base_products, products
+from products import inputs_key, multiplier_cap
+from precompute import get_product_bitmap
+from transitions import get_transition_table
+from instrumentation import record_cache
+from mapped_file import write_mapped, MappedFile, load_or_build, load_stored
+from lru import LRUCache
+
+NET_CHANGES = 8
+PEAK_CHANGES = 4
+CHUNK_SIZE = 1 << 18
+MAGIC = b"MIXSUF03"
+
+def suffix_key(table, base, supplemental_products, max_effects=8, depth=None, net_changes=NET_CHANGES, peak_changes=PEAK_CHANGES):
+    """
+    inputs_key of everything SuffixTables depend on: the base, the products in
+    order, the effect caps, the depth and the table layout. State ids do not
+    enter it, so stored tables serve any transition table over the same rules.
+    """
+    return inputs_key(supplemental_products, base, table_max_effects=table.max_effects, max_effects=max_effects, depth=depth,
+                      changes=[net_changes, peak_changes], format=MAGIC.decode())
+
+def fixed_point(table, states, expand, own, invalid, columns, prices, changes, max_sweeps=None, stop=None):
+    """
+    One relaxed DP over a closure: the best own - cost over at most r mixes from
+    each state, for r = 1, 2, ... until nothing changes or r reaches max_sweeps.
+    Only states with a
+    successor that changed in the previous sweep are recomputed, which leaves a
+    small fraction of the closure for most sweeps. Immediate repeats stay ruled
+    out: besides its best, a state keeps the product that best starts with and
+    `alt`, its best when that product was the last one mixed in, which is all its
+    predecessors need.
+
+    The best only rises a few times as r grows, so per state of states it is kept
+    as its last `changes` changes, most recent first: values[k] is what it rose to
+    (float32 rounded up) and steps[k] the r that took (capped at 255, which only
+    loosens the bound). A state with fewer changes ends with its own value at
+    r = 0. Returns (values, steps, sweeps), or None once stop() returns True.
+    """
+    all_columns = np.array_equal(columns, np.arange(len(table.products)))
+    positions = np.arange(len(columns))
+    # Over the cap a state is out of reach: -inf keeps it out of every max.
+    best = np.where(invalid, -np.inf, own)
+    alt = best.copy()
+    first = np.full(len(best), -1, dtype=np.int8)
+    values = np.tile(np.nextafter(own.astype(np.float32), np.float32(np.inf)), (changes, 1))
+    steps = np.zeros((changes, len(best)), dtype=np.uint8)
+    changed = np.ones(len(best), dtype=bool)
+    sweeps = 0
+    while True:
+        if stop is not None and stop():
+            return None
+        reach, reach_alt, reach_first = best.copy(), alt.copy(), first.copy()
+        fresh = np.zeros(len(best), dtype=bool)
+        for start in range(0, len(expand), CHUNK_SIZE):
+            chunk = expand[start:start + CHUNK_SIZE]
+            successors = table.next_state[chunk] if all_columns else table.next_state[chunk][:, columns]
+            active = changed[successors].any(axis=1)
+            chunk, successors = chunk[active], successors[active]
+            arrived = np.where(first[successors] == positions, alt[successors], best[successors]) - prices
+            top = arrived.argmax(axis=1)
+            rows = np.arange(len(chunk))
+            value = np.maximum(own[chunk], arrived[rows, top])
+            arrived[rows, top] = -np.inf
+            second = np.maximum(own[chunk], arrived.max(axis=1))
+            moved = (value != best[chunk]) | (second != alt[chunk]) | (top != first[chunk])
+            fresh[chunk[moved]] = True
+            reach[chunk], reach_alt[chunk], reach_first[chunk] = value, second, top
+        sweeps += 1
+        if not fresh.any():
+            break
+        rose = np.flatnonzero(reach != best)
+        best, alt, first, changed = reach, reach_alt, reach_first, fresh
+        values[1:, rose], steps[1:, rose] = values[:-1, rose], steps[:-1, rose]
+        values[0, rose] = np.nextafter(best[rose].astype(np.float32), np.float32(np.inf))
+        steps[0, rose] = min(sweeps, 255)
+        if sweeps == max_sweeps:
+            break
+    return values[:, states], steps[:, states], sweeps
+
+def at(values, steps, remaining):
+    """Bound after at most `remaining` mixes from one state's (values, steps) lists, most recent change first."""
+    return next((value for value, step in zip(values, steps) if step <= remaining), values[-1])
+
+class SuffixTables:
+    """
+    Bounds for one base, product set and effect cap over the base's closure within
+    depth mixes (all of it if None), indexed by effect mask and aligned with the
+    ascending masks: suffix as (values, steps), peak as (peaks, peak_steps), each
+    in fixed_point's layout (see at), and rebated, the last value of the DP with
+    prices lowered by rebate.
+    """
+    def __init__(self, masks, values, steps, peaks, peak_steps, rebated, rebate, price, cap, depth=None, iterations=0):
+        self.masks = masks
+        self.values = values
+        self.steps = steps
+        self.peaks = peaks
+        self.peak_steps = peak_steps
+        self.rebated = rebated
+        self.rebate = rebate
+        self.price = price
+        self.cap = cap
+        self.depth = depth
+        self.iterations = iterations
+        self.closure_size = len(masks)
+        self._file = None
+
+    @classmethod
+    def build(cls, table, base, supplemental_products, max_effects=8, depth=None, net_changes=NET_CHANGES, peak_changes=PEAK_CHANGES, stop=None):
+        """
+        Run the three DPs over a private copy of table, for depth sweeps at most;
+        None if stop() ended the build early.
+        """
+        table = table.private()
+        columns = np.array([table.product_index[p.name] for p in supplemental_products], dtype=np.int64)
+        prices = np.array([p.price for p in supplemental_products], dtype=np.float64)
+        cache = table.hits, table.misses
+        states, distance = table.closure([table.initial_state(base)], columns, depth, stop=stop)
+        record_cache(table, cache)
+        if stop is not None and stop():
+            return None
+        # States at the depth limit are left unexpanded; their own value is all that is asked of them.
+        inner = table.effect_count[states] < max_effects
+        if depth is not None:
+            inner &= distance < depth
+        expand = states[inner]
+        invalid = table.effect_count[:len(table)] > max_effects
+        own = base.price * table.multiplier[:len(table)]
+        rebate = float(prices.min())
+        runs = []
+        for step_prices, changes in ((prices, net_changes), (np.zeros_like(prices), peak_changes), (prices - rebate, 1)):
+            run = fixed_point(table, states, expand, own, invalid, columns, step_prices, changes, depth, stop)
+            if run is None:
+                return None
+            runs.append(run)
+        (values, steps, net_sweeps), (peaks, peak_steps, peak_sweeps), (rebated, _, rebated_sweeps) = runs
+        order = np.argsort(table.masks[states])
+        return cls(table.masks[states][order], values[:, order], steps[:, order], peaks[:, order], peak_steps[:, order],
+                   rebated[0][order], rebate, base.price, base.price * multiplier_cap(max_effects), depth,
+                   net_sweeps + peak_sweeps + rebated_sweeps)
+
+    def serves(self, max_length):
+        """Whether these tables bound every label of a search up to max_length."""
+        return self.depth is None or max_length - 1 <= self.depth
+
+    def save(self, path):
+        header = {"rebate": self.rebate, "price": self.price, "cap": self.cap, "depth": self.depth, "iterations": self.iterations}
+        arrays = {"masks": self.masks.astype("<u8")}
+        for name in ("values", "peaks", "rebated"):
+            arrays[name] = getattr(self, name).astype("<f4")
+        for name in ("steps", "peak_steps"):
+            arrays[name] = getattr(self, name).astype(np.uint8)
+        write_mapped(path, MAGIC, header, arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Tables saved by save(), memory-mapped so processes loading the same file share one copy."""
+        mapped = MappedFile(path, MAGIC, "suffix tables")
+        header, arrays = mapped.header, mapped.arrays
+        tables = cls(arrays["masks"], arrays["values"], arrays["steps"], arrays["peaks"], arrays["peak_steps"], arrays["rebated"],
+                     header["rebate"], header["price"], header["cap"], header["depth"], header["iterations"])
+        tables._file = mapped
+        return tables
+
+    def column(self, mask):
+        """(values, steps, peaks, peak_steps, rebated) at mask, the arrays as lists; None outside the closure."""
+        i = int(np.searchsorted(self.masks, mask))
+        if i == len(self.masks) or self.masks[i] != mask:
+            return None
+        return (self.values[:, i].tolist(), self.steps[:, i].tolist(), self.peaks[:, i].tolist(), self.peak_steps[:, i].tolist(),
+                self.rebated.item(i))
+
+TABLE_CACHE_SIZE = 8
+_tables = LRUCache(TABLE_CACHE_SIZE)
+
+def get_suffix_tables(table, base, supplemental_products, max_effects=8, max_length=None, cache_dir=SUFFIX_CACHE_DIR, stop=None, build=True):
+    """
+    SuffixTables for one base, product set and prices that serve max_length (any
+    length if None): stored whole-closure tables if there are any, else tables of
+    depth max_length - 1 through load_or_build under their suffix_key. With
+    build=False, stored tables only. None if there are none to use or stop()
+    ended a build early.
+    """
+    depth = None if max_length is None else max(1, max_length - 1)
+    if depth is not None:
+        whole = load_stored(_tables, suffix_key(table, base, supplemental_products, max_effects), cache_dir, SuffixTables.load)
+        if whole is not None:
+            return whole
+    key = suffix_key(table, base, supplemental_products, max_effects, depth)
+    if not build:
+        return load_stored(_tables, key, cache_dir, SuffixTables.load)
+    return load_or_build(_tables, key, cache_dir, SuffixTables.load,
+                         lambda: SuffixTables.build(table, base, supplemental_products, max_effects, depth, stop=stop), SUFFIX_CACHE_MAX_BYTES)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and store the branch and bound suffix tables for every base at one level.")
+    parser.add_argument("--level", default=AVAILABLE_LEVELS[-1], choices=AVAILABLE_LEVELS)
+    parser.add_argument("--max-length", type=int, help="longest sequence the tables serve (default: any, over the whole closure)")
+    parser.add_argument("--max-effects", type=int, default=8)
+    parser.add_argument("--cache-dir", default=SUFFIX_CACHE_DIR)
+    parser.add_argument("--transitions", default=TRANSITIONS_FILE, help="transition table to start from, if it exists")
+    args = parser.parse_args(argv)
+
+    bitmap = get_product_bitmap(args.level)
+    allowed = [p for i, p in enumerate(products) if (bitmap >> i) & 1]
+    # One private table for every base, so each build reuses the rows the last one expanded.
+    table = get_transition_table(args.transitions).private()
+    for base in base_products:
+        tables = get_suffix_tables(table, base, allowed, args.max_effects, args.max_length, args.cache_dir)
+        print(f"{base.name}: {tables.closure_size} masks, {tables.iterations} iterations")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
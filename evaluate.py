@@ -0,0 +1,142 @@
+"""
+Batch evaluation of mixing sequences against the current rules.
+
+Sequences are read one per line, product names separated by commas, tabs or
+"+" (the optimizer's own "A + B" output works as input). A line may start with
+a base product to score it for that base only; otherwise it is scored for every
+base. Lines are evaluated and written one at a time, and intermediate masks are
+shared through a bounded LRU of sequence prefixes, so memory stays flat however
+long the input is.
+"""
+import re
+import sys
+import csv
+import json
+import math
+import argparse
+from functools import lru_cache
+from rules import base_products, products
+from products import bitmask_to_effects, compute_multiplier
+from rule_compiler import compile_products
+from lru import LRUCache
+
+PREFIX_CACHE_SIZE = 1 << 16
+SEPARATOR = re.compile(r"\s*[,+\t]\s*")
+FIELDS = ["line", "base", "sequence", "effects", "total_multiplier", "cost", "net_benefit", "expected_total_value"]
+
+@lru_cache(maxsize=PREFIX_CACHE_SIZE)
+def describe(mask):
+    """(effect names, multiplier) of a mask."""
+    return bitmask_to_effects(mask), compute_multiplier(mask)
+
+class SequenceEvaluator:
+    """Effect masks of product sequences from every base, caching up to cache_size prefixes."""
+    def __init__(self, bases=None, product_list=None, max_effects=8, cache_size=PREFIX_CACHE_SIZE):
+        self.bases = list(base_products if bases is None else bases)
+        product_list = list(products if product_list is None else product_list)
+        self.products = {p.name: p for p in product_list}
+        self.evaluators = dict(zip(self.products, compile_products(product_list)))
+        self.base_index = {base.name: i for i, base in enumerate(self.bases)}
+        self.max_effects = max_effects
+        self.roots = tuple(base.process(0, max_effects) for base in self.bases)
+        self.prefixes = LRUCache(cache_size)
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, line):
+        """(base names, product names) of one input line; ValueError on unknown names."""
+        names = [name for name in SEPARATOR.split(line.strip()) if name]
+        bases = [base.name for base in self.bases]
+        if names and names[0] in self.base_index:
+            bases, names = [names[0]], names[1:]
+        unknown = [name for name in names if name not in self.products]
+        if unknown:
+            raise ValueError(f"unknown products {unknown}")
+        return bases, tuple(names)
+
+    def masks(self, names):
+        """Final mask from each base's initial mask (in self.bases order) after mixing names."""
+        depth, masks = 0, self.roots
+        for k in range(len(names), 0, -1):
+            cached = self.prefixes.get(names[:k])
+            if cached is not None:
+                depth, masks = k, cached
+                break
+        self.hits += depth
+        self.misses += len(names) - depth
+        for k in range(depth, len(names)):
+            evaluate = self.evaluators[names[k]]
+            masks = tuple([evaluate(mask, self.max_effects) for mask in masks])
+            self.prefixes.put(names[:k + 1], masks)
+        return masks
+
+    def evaluate(self, line):
+        """One result row per base for an input line, in the optimizer's candidate format."""
+        bases, names = self.parse(line)
+        masks = self.masks(names)
+        cost = sum(self.products[name].price for name in names)
+        rows = []
+        for base_name in bases:
+            base = self.bases[self.base_index[base_name]]
+            effects, multiplier = describe(masks[self.base_index[base_name]])
+            rows.append({
+                "base": base.name,
+                "sequence": [base.name, *names],
+                "effects": list(effects),
+                "total_multiplier": multiplier,
+                "cost": cost,
+                "net_benefit": base.price * multiplier - cost,
+                "expected_total_value": math.ceil(base.price * (1 + multiplier)),
+            })
+        return rows
+
+def evaluate_lines(lines, evaluator=None):
+    """
+    Stream (line number, rows, error) for every non-blank, non-comment line; error
+    is None or the message for a line that could not be parsed.
+    """
+    evaluator = evaluator or SequenceEvaluator()
+    for number, line in enumerate(lines, start=1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        try:
+            yield number, evaluator.evaluate(line), None
+        except ValueError as e:
+            yield number, [], str(e)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score mixing sequences, one per line, against the current rules.")
+    parser.add_argument("input", nargs="?", default="-", help="file of sequences (default: stdin)")
+    parser.add_argument("--base", action="append", choices=[bp.name for bp in base_products], help="base to score for (repeatable, default all)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--output", default="-", help="where to write results (default: stdout)")
+    args = parser.parse_args(argv)
+
+    bases = [bp for bp in base_products if args.base is None or bp.name in args.base]
+    evaluator = SequenceEvaluator(bases)
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    errors = 0
+    try:
+        writer = csv.writer(sink) if args.format == "csv" else None
+        if writer:
+            writer.writerow(FIELDS)
+        for number, rows, error in evaluate_lines(source, evaluator):
+            if error:
+                errors += 1
+                print(f"line {number}: {error}", file=sys.stderr)
+            for row in rows:
+                if writer:
+                    writer.writerow([number, row["base"], " + ".join(row["sequence"]), "; ".join(row["effects"]),
+                                     f'{row["total_multiplier"]:.2f}', row["cost"], f'{row["net_benefit"]:.2f}', row["expected_total_value"]])
+                else:
+                    sink.write(json.dumps(dict(row, line=number)) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import math
+import numpy as np
+from products import bitmask_to_effects
+from transitions import get_transition_table
+from instrumentation import record, record_cache
+
+INF_COST = np.iinfo(np.int64).max
+CHUNK_SIZE = 1 << 20
+
+class CostMap:
+    """Sorted int64 keys -> minimal cost, queried and updated a whole batch at a time."""
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.costs = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys, presorted=False):
+        """Stored costs for keys, INF_COST where a key is absent."""
+        if presorted:
+            pos = np.searchsorted(self.keys, keys)
+        else:
+            # searchsorted is several times faster on sorted needles
+            order = np.argsort(keys)
+            pos = np.empty(len(keys), dtype=np.int64)
+            pos[order] = np.searchsorted(self.keys, keys[order])
+        inside = pos < len(self.keys)
+        found = np.zeros(len(keys), dtype=bool)
+        found[inside] = self.keys[pos[inside]] == keys[inside]
+        prior = np.full(len(keys), INF_COST, dtype=np.int64)
+        prior[found] = self.costs[pos[found]]
+        return prior, pos, found
+
+    def improve(self, keys, costs):
+        """
+        Replays "push if cheaper than anything seen for this key" over a batch in order:
+        element j passes when costs[j] is below the stored cost and every earlier cost
+        with the same key. Stores the new minima and returns the mask of passing elements.
+        """
+        n = len(keys)
+        if n == 0:
+            return np.zeros(0, dtype=bool)
+        order = np.argsort(keys, kind="stable")
+        k, c = keys[order], costs[order]
+        starts = np.ones(n, dtype=bool)
+        starts[1:] = k[1:] != k[:-1]
+        group = np.cumsum(starts) - 1
+        span = int(c.max()) + 1
+        running = np.minimum.accumulate(c - group * span) + group * span
+        earlier = np.empty(n, dtype=np.int64)
+        earlier[0] = INF_COST
+        earlier[1:] = running[:-1]
+        earlier[starts] = INF_COST
+
+        unique_keys = k[starts]
+        prior, pos, found = self.lookup(unique_keys, presorted=True)
+        passed_sorted = (c < earlier) & (c < prior[group])
+        passed = np.empty(n, dtype=bool)
+        passed[order] = passed_sorted
+
+        group_min = np.minimum(prior, np.minimum.reduceat(c, np.flatnonzero(starts)))
+        self.costs[pos[found]] = group_min[found]
+        if not found.all():
+            self.keys = np.insert(self.keys, pos[~found], unique_keys[~found])
+            self.costs = np.insert(self.costs, pos[~found], group_min[~found])
+        return passed
+
+def make_candidate(base, names, table, sid, cost):
+    return mask_candidate(base, names, int(table.masks[sid]), table.multiplier.item(sid), cost)
+
+def mask_candidate(base, names, mask, multiplier, cost):
+    return {
+        "sequence": names,
+        "effects": bitmask_to_effects(mask),
+        "total_multiplier": multiplier,
+        "cost": cost,
+        "net_benefit": base.price * multiplier - cost,
+        "expected_total_value": math.ceil(base.price * (1 + multiplier))
+    }
+
+def sequence_names(base, table, layers, depth, index):
+    names = []
+    while depth > 1:
+        layer = layers[depth]
+        names.append(table.products[layer["last"][index]].name)
+        index = layer["parent"][index]
+        depth -= 1
+    return [base.name] + names[::-1]
+
+def root_layer(table, base):
+    """The one-state layer of length 1: the base on its own."""
+    return {
+        "sid": np.array([table.initial_state(base)], dtype=np.int64),
+        "cost": np.zeros(1, dtype=np.int64),
+        "drop": np.zeros(1, dtype=np.int64),
+        "last": np.full(1, -1, dtype=np.int64),
+        "parent": np.full(1, -1, dtype=np.int64),
+    }
+
+def select(layer, index):
+    return {name: column[index] for name, column in layer.items()}
+
+def concat_layers(parts):
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+def state_keys(table, layer):
+    return ((layer["sid"] * (len(table.products) + 1)) + layer["last"] + 1) * 3 + layer["drop"]
+
+def expand_layer(table, layer, parents, columns, prices, max_effects):
+    """
+    Children of layer[parents] over the given table columns, parent-major and
+    column-minor (the scalar BFS push order), minus immediate repeats, children over
+    the effect cap and children that would reach three multiplier drops. "last"
+    holds the table column of the product that produced each child.
+    """
+    parent_sid = layer["sid"][parents]
+    table.expand_many(parent_sid)
+    child_sid = table.next_state[parent_sid][:, columns].astype(np.int64)
+    child_last = np.broadcast_to(columns, child_sid.shape)
+    child_drop = layer["drop"][parents, None] + (table.multiplier[child_sid] < table.multiplier[parent_sid][:, None])
+    child_cost = layer["cost"][parents, None] + prices[None, :]
+    repeat = child_last == layer["last"][parents, None]
+    over_cap = table.effect_count[child_sid] > max_effects
+    keep = ~repeat & ~over_cap & (child_drop < 3)
+    record(pruned_effect_cap=int((over_cap & ~repeat).sum()), pruned_drop=int((~repeat & ~over_cap).sum() - keep.sum()))
+    return {
+        "sid": child_sid[keep],
+        "cost": child_cost[keep],
+        "drop": child_drop[keep],
+        "last": child_last[keep],
+        "parent": np.broadcast_to(parents[:, None], child_sid.shape)[keep],
+    }
+
+def grow_layer(table, visited, parents, children_of, width, final):
+    """
+    Next layer from the candidates children_of(parent_chunk) yields, about CHUNK_SIZE
+    at a time. The visited check is sequential, so chunking does not change what gets
+    admitted. The final layer is never expanded, so its candidates are only checked
+    against earlier layers and then kept only where they undercut every earlier
+    candidate with the same mask: a candidate dropped this way has a cheaper-or-equal
+    twin ahead of it and can never be the layer's first-best by net or by value, so
+    scoring is unaffected.
+    """
+    step = max(1, CHUNK_SIZE // max(1, width))
+    cheapest_final = CostMap() if final else None
+    parts = []
+    for start in range(0, len(parents), step):
+        candidates = children_of(parents[start:start + step])
+        keys = state_keys(table, candidates)
+        if final:
+            admitted = candidates["cost"] < visited.lookup(keys)[0]
+            admitted[admitted] = cheapest_final.improve(candidates["sid"][admitted], candidates["cost"][admitted])
+        else:
+            admitted = visited.improve(keys, candidates["cost"])
+        pushed = int(admitted.sum())
+        record(states_pushed=pushed, pruned_visited=len(admitted) - pushed)
+        parts.append(select(candidates, admitted))
+    return concat_layers(parts) if parts else None
+
+def record_final_layer(layers, max_length):
+    """States of length max_length are popped but never expanded."""
+    if len(layers) > max_length:
+        record(states_popped=len(layers[max_length]["sid"]), pruned_length=len(layers[max_length]["sid"]))
+
+def layer_results(base, table, layers):
+    """best_value / best_net / by_length over layers, breaking ties by BFS order."""
+    best_by_length = {}
+    best_net = best_value = None
+    best_net_key = best_value_key = None
+    for length in range(1, len(layers)):
+        sid, cost = layers[length]["sid"], layers[length]["cost"]
+        multiplier = table.multiplier[sid]
+        net = base.price * multiplier - cost
+        total_value = np.ceil(base.price * (1 + multiplier))
+        i = int(np.argmax(net))
+        best_by_length[length] = make_candidate(base, sequence_names(base, table, layers, length, i), table, int(sid[i]), int(cost[i]))
+        if best_net_key is None or net[i] > best_net_key:
+            best_net, best_net_key = best_by_length[length], net[i]
+        top = np.flatnonzero(total_value == total_value.max())
+        j = int(top[np.argmin(cost[top])])
+        if best_value_key is None or (total_value[j], -cost[j]) > best_value_key:
+            best_value = make_candidate(base, sequence_names(base, table, layers, length, j), table, int(sid[j]), int(cost[j]))
+            best_value_key = (total_value[j], -cost[j])
+    return {
+        "best_value": best_value,
+        "best_net": best_net,
+        "by_length": best_by_length
+    }
+
+def find_best_sequences_by_layer(base, supplemental_products, max_length=10, max_effects=8, table=None, bound=True):
+    """
+    Level-synchronous version of find_best_sequences_by_length_for_base_cost: each
+    sequence length is expanded as one batch of NumPy arrays. States are kept in the
+    same order the scalar BFS pops them, and the running global best, the delta_max
+    bound and the visited check are replayed in that order, so results match exactly.
+    With bound=False the delta_max pruning is skipped and the search is exhaustive up
+    to the visited dominance.
+    """
+    if table is None:
+        table = get_transition_table()
+    columns = np.array([table.product_index[p.name] for p in supplemental_products], dtype=np.int64)
+    prices = np.array([p.price for p in supplemental_products], dtype=np.int64)
+    empty_state = table.state(0)
+    delta_max = max(base.price * table.multiplier.item(table.step(empty_state, c)) - p.price for c, p in zip(columns.tolist(), supplemental_products))
+    visited = CostMap()
+    root = root_layer(table, base)
+    layers = [None, root]
+    global_best_net = base.price * table.multiplier.item(int(root["sid"][0]))
+    cache = table.hits, table.misses
+    for length in range(1, max_length):
+        layer = layers[length]
+        expand = table.effect_count[layer["sid"]] < max_effects
+        record(states_popped=len(expand), pruned_effect_cap=len(expand) - int(expand.sum()))
+        if bound:
+            net = base.price * table.multiplier[layer["sid"]] - layer["cost"]
+            running_best = np.maximum(np.maximum.accumulate(net), global_best_net)
+            global_best_net = float(running_best[-1])
+            pruned = expand & (net + (max_length - length) * delta_max < running_best)
+            record(pruned_bound=int(pruned.sum()))
+            expand &= ~pruned
+        parents = np.flatnonzero(expand)
+        children_of = lambda chunk: expand_layer(table, layer, chunk, columns, prices, max_effects)
+        next_layer = grow_layer(table, visited, parents, children_of, len(columns), length + 1 == max_length)
+        if next_layer is None or len(next_layer["sid"]) == 0:
+            break
+        layers.append(next_layer)
+    record_final_layer(layers, max_length)
+    record_cache(table, cache)
+    return layer_results(base, table, layers)
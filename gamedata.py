@@ -0,0 +1,72 @@
+"""
+Snapshot of the compiled game data: effect bit order and multipliers, every base
+and product with its price and rule masks (product_spec), and the unlock bitmap
+of each level. Building it means importing rules.py, which constructs every Rule
+and Product; the snapshot is a small JSON file keyed by a hash of the source
+modules, so short runs read it instead and it is rebuilt only after one of them
+changes.
+"""
+import os
+import json
+import hashlib
+from config import GAME_DATA_FILE, AVAILABLE_LEVELS, product_unlock_levels, multipliers
+
+SOURCES = ("config.py", "products.py", "rules.py")
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_game_data = None
+
+def source_fingerprint():
+    """Hash of the modules the game data is defined in."""
+    digest = hashlib.sha256()
+    for name in SOURCES:
+        with open(os.path.join(SOURCE_DIR, name), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def unlock_bitmap(level):
+    """Bitmap of the products unlocked at a level (bit i is products[i])."""
+    level_index = AVAILABLE_LEVELS.index(level)
+    bitmap = 0
+    for i, unlock_level in enumerate(product_unlock_levels):
+        if AVAILABLE_LEVELS.index(unlock_level) <= level_index:
+            bitmap |= (1 << i)
+    return bitmap
+
+def build_game_data(fingerprint=None):
+    from rules import base_products, products
+    from products import product_spec
+    def entry(product):
+        return {"name": product.name, "price": product.price, "spec": product_spec(product)}
+    return {
+        "fingerprint": fingerprint or source_fingerprint(),
+        "effects": list(multipliers),
+        "multipliers": list(multipliers.values()),
+        "bases": [entry(bp) for bp in base_products],
+        "products": [entry(p) for p in products],
+        "unlock_bitmaps": {level: unlock_bitmap(level) for level in AVAILABLE_LEVELS},
+    }
+
+def load_game_data(path=GAME_DATA_FILE):
+    """
+    The game data snapshot at path, rebuilt and rewritten first if it is missing,
+    unreadable or was built from different sources. Cached for the process.
+    """
+    global _game_data
+    fingerprint = source_fingerprint()
+    if _game_data is not None and _game_data["fingerprint"] == fingerprint:
+        return _game_data
+    data = None
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except ValueError:
+            data = None
+    if data is None or data.get("fingerprint") != fingerprint:
+        data = build_game_data(fingerprint)
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+    _game_data = data
+    return data
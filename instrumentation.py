@@ -0,0 +1,44 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Process-wide totals of every counter the search engines record.
+stats = Counter()
+# Callables run with each finished timed() record.
+hooks = []
+_collectors = []
+
+def record(**counts):
+    """Add counts to the process totals and to every open collect() block."""
+    stats.update(counts)
+    for collector in _collectors:
+        collector.update(counts)
+
+def record_cache(table, start):
+    """Record the transition table hits and misses since start = (hits, misses)."""
+    record(cache_hits=table.hits - start[0], cache_misses=table.misses - start[1])
+
+@contextmanager
+def collect():
+    """Counter of everything recorded while the block runs."""
+    counts = Counter()
+    _collectors.append(counts)
+    try:
+        yield counts
+    finally:
+        _collectors.remove(counts)
+
+@contextmanager
+def timed(**info):
+    """
+    Time a block and collect its counters into a record dict (info plus "seconds"
+    and "counters"), which is handed to every hook once the block finishes.
+    """
+    entry = dict(info)
+    start = time.perf_counter()
+    with collect() as counts:
+        yield entry
+    entry["seconds"] = time.perf_counter() - start
+    entry["counters"] = dict(counts)
+    for hook in hooks:
+        hook(entry)
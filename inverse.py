@@ -0,0 +1,230 @@
+"""
+Inverse queries: the cheapest (or shortest) mixing sequence from a base product
+whose effects include every required effect and none of the forbidden ones.
+
+A ReachIndex holds every mask reachable from one base through a product set
+within max_length, with its minimal cost and its fewest mixes, found by a
+layered Bellman-Ford over the transition table. A query is then one vectorized
+scan over the reachable masks plus a walk up the parent pointers. Unlike the
+optimizer's engines, sequences may repeat a product and drop the multiplier any
+number of times: every sequence the game allows is a candidate.
+
+Indexes are kept in REACH_CACHE_DIR under their index_key (see
+mapped_file.load_or_build).
+"""
+import sys
+import argparse
+import numpy as np
+from config import AVAILABLE_LEVELS, REACH_CACHE_DIR, REACH_CACHE_MAX_BYTES
+from rules import base_products, products
+from products import compute_multiplier, effect_to_bit, inputs_key
+from frontier import mask_candidate, INF_COST
+from precompute import get_product_bitmap
+from transitions import get_transition_table
+from instrumentation import record, record_cache
+from mapped_file import write_mapped, MappedFile, load_or_build
+from lru import LRUCache
+
+MAGIC = b"MIXRCH01"
+UNREACHED = np.iinfo(np.uint8).max
+OBJECTIVES = ("cost", "length")
+
+class ReachIndex:
+    """
+    Reachable masks of base within max_length (the base counts as the first entry,
+    as in the optimizer), in ascending order. Per mask: the minimal cost and the
+    layer it was reached at, and the fewest mixes with the cheapest cost among
+    sequences that short. layers[d] holds the masks whose minimal cost improved
+    with d mixes: their positions in `masks` (ascending), the position of their
+    parent in layers[d - 1] and the product mixed in. Every mask's parent improved
+    one layer earlier, so parent chains always stay within their layer count.
+
+    Nothing refers to a transition table's state ids, so an index can be saved and
+    loaded by any process (see get_reach_index).
+    """
+    def __init__(self, base, supplemental_products, max_length, arrays):
+        self.base = base
+        self.supplemental_products = list(supplemental_products)
+        self.max_length = max_length
+        for name in ("masks", "cost", "cost_layer", "length", "length_cost"):
+            setattr(self, name, arrays[name])
+        self.layers = []
+        while f"layer{len(self.layers)}_state" in arrays:
+            self.layers.append({field: arrays[f"layer{len(self.layers)}_{field}"] for field in ("state", "parent", "product")})
+        self._file = None
+
+    @classmethod
+    def build(cls, base, supplemental_products, max_length=9, table=None):
+        """Run the layered Bellman-Ford over a private copy of table (the shared one if None)."""
+        if table is None:
+            table = get_transition_table()
+        table = table.private()
+        columns = np.array([table.product_index[p.name] for p in supplemental_products], dtype=np.int64)
+        prices = np.array([p.price for p in supplemental_products], dtype=np.int64)
+        cache = table.hits, table.misses
+
+        root = table.initial_state(base)
+        best = np.full(len(table), INF_COST, dtype=np.int64)
+        best_layer = np.full(len(table), UNREACHED, dtype=np.uint8)
+        best[root], best_layer[root] = 0, 0
+        first_layer, first_cost = best_layer.copy(), best.copy()
+        layers = [{"sid": np.array([root], dtype=np.int64), "parent": np.array([-1], dtype=np.int32), "product": np.array([-1], dtype=np.int8)}]
+        frontier, frontier_cost = layers[0]["sid"], np.array([0], dtype=np.int64)
+        for depth in range(1, max_length):
+            if not len(frontier) or not len(columns):
+                break
+            table.expand_many(frontier)
+            if len(best) < len(table):
+                grow = len(table) - len(best)
+                best = np.concatenate([best, np.full(grow, INF_COST, dtype=np.int64)])
+                best_layer = np.concatenate([best_layer, np.full(grow, UNREACHED, dtype=np.uint8)])
+                first_layer = np.concatenate([first_layer, np.full(grow, UNREACHED, dtype=np.uint8)])
+                first_cost = np.concatenate([first_cost, np.full(grow, INF_COST, dtype=np.int64)])
+            targets = table.next_state[frontier][:, columns].astype(np.int64).ravel()
+            costs = (frontier_cost[:, None] + prices[None, :]).ravel()
+            order = np.lexsort((costs, targets))
+            targets, first = np.unique(targets[order], return_index=True)
+            picked = order[first]
+            costs = costs[picked]
+            improved = costs < best[targets]
+            targets, costs, picked = targets[improved], costs[improved], picked[improved]
+            best[targets], best_layer[targets] = costs, depth
+            new = first_layer[targets] == UNREACHED
+            first_layer[targets[new]], first_cost[targets[new]] = depth, costs[new]
+            layers.append({
+                "sid": targets,
+                "parent": (picked // len(columns)).astype(np.int32),
+                "product": (picked % len(columns)).astype(np.int8),
+            })
+            frontier, frontier_cost = targets, costs
+        record(states_pushed=sum(len(layer["sid"]) for layer in layers))
+        record_cache(table, cache)
+
+        # From state ids to positions in the ascending masks, keeping parent links.
+        sids = np.flatnonzero(first_layer != UNREACHED)
+        sids = sids[np.argsort(table.masks[sids], kind="stable")]
+        position = np.full(len(best), -1, dtype=np.int32)
+        position[sids] = np.arange(len(sids), dtype=np.int32)
+        arrays = {
+            "masks": table.masks[sids],
+            "cost": best[sids],
+            "cost_layer": best_layer[sids],
+            "length": first_layer[sids],
+            "length_cost": first_cost[sids],
+        }
+        moved = None
+        for depth, layer in enumerate(layers):
+            state = position[layer["sid"]]
+            order = np.argsort(state, kind="stable")
+            arrays[f"layer{depth}_state"] = state[order]
+            arrays[f"layer{depth}_parent"] = layer["parent"][order] if moved is None else moved[layer["parent"][order]]
+            arrays[f"layer{depth}_product"] = layer["product"][order]
+            moved = np.empty(len(order), dtype=np.int32)
+            moved[order] = np.arange(len(order), dtype=np.int32)
+        return cls(base, supplemental_products, max_length, arrays)
+
+    def save(self, path):
+        arrays = {name: getattr(self, name) for name in ("masks", "cost", "cost_layer", "length", "length_cost")}
+        for depth, layer in enumerate(self.layers):
+            arrays.update((f"layer{depth}_{field}", values) for field, values in layer.items())
+        write_mapped(path, MAGIC, {"max_length": self.max_length}, arrays)
+
+    @classmethod
+    def load(cls, path, base, supplemental_products):
+        """An index saved by save(), memory-mapped; base and products must be the ones it was built for."""
+        mapped = MappedFile(path, MAGIC, "reach index")
+        index = cls(base, supplemental_products, mapped.header["max_length"], mapped.arrays)
+        index._file = mapped
+        return index
+
+    def __len__(self):
+        return len(self.masks)
+
+    def names(self, i, depth):
+        """Product names along the chain that reaches masks[i] with `depth` mixes."""
+        names = []
+        position = int(np.searchsorted(self.layers[depth]["state"], i))
+        while depth > 0:
+            layer = self.layers[depth]
+            names.append(self.supplemental_products[layer["product"][position]].name)
+            position = int(layer["parent"][position])
+            depth -= 1
+        return [self.base.name] + names[::-1]
+
+    def query(self, required=0, forbidden=0, objective="cost"):
+        """
+        Cheapest sequence (objective "cost", ties to fewer mixes) or shortest one
+        (objective "length", ties to the cheaper) whose mask has every bit of
+        `required` and none of `forbidden`, as an optimizer candidate; None if no
+        sequence within max_length does.
+        """
+        if objective not in OBJECTIVES:
+            raise ValueError(f"objective must be one of {OBJECTIVES}")
+        matches = np.flatnonzero(((self.masks & np.uint64(required)) == np.uint64(required)) & ((self.masks & np.uint64(forbidden)) == 0))
+        if not len(matches):
+            return None
+        if objective == "cost":
+            i = matches[np.lexsort((self.cost_layer[matches], self.cost[matches]))[0]]
+            cost, depth = self.cost[i], self.cost_layer[i]
+        else:
+            i = matches[np.lexsort((self.length_cost[matches], self.length[matches]))[0]]
+            cost, depth = self.length_cost[i], self.length[i]
+        mask = int(self.masks[i])
+        return mask_candidate(self.base, self.names(int(i), int(depth)), mask, compute_multiplier(mask), int(cost))
+
+def effect_mask(effects):
+    unknown = [effect for effect in effects if effect not in effect_to_bit]
+    if unknown:
+        raise ValueError(f"unknown effects {unknown}")
+    return sum(effect_to_bit[effect] for effect in set(effects))
+
+def index_key(base, supplemental_products, max_length=9, table_max_effects=8):
+    """inputs_key of everything a ReachIndex depends on."""
+    return inputs_key(supplemental_products, base, max_length=max_length, max_effects=table_max_effects, format=MAGIC.decode())
+
+INDEX_CACHE_SIZE = 4
+_indexes = LRUCache(INDEX_CACHE_SIZE)
+
+def get_reach_index(base, supplemental_products, max_length=9, table=None, cache_dir=REACH_CACHE_DIR):
+    """
+    ReachIndex for these products and prices, through load_or_build under its
+    index_key; built over table.
+    """
+    if table is None:
+        table = get_transition_table()
+    key = index_key(base, supplemental_products, max_length, table.max_effects)
+    return load_or_build(_indexes, key, cache_dir, lambda path: ReachIndex.load(path, base, supplemental_products),
+                         lambda: ReachIndex.build(base, supplemental_products, max_length, table), REACH_CACHE_MAX_BYTES)
+
+def find_sequence_for_effects(base, supplemental_products, required, forbidden=(), objective="cost", max_length=9, table=None):
+    """Cheapest or shortest sequence reaching every `required` effect and no `forbidden` one, or None."""
+    index = get_reach_index(base, supplemental_products, max_length, table)
+    return index.query(effect_mask(required), effect_mask(forbidden), objective)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the cheapest or shortest sequence that reaches a set of effects.")
+    parser.add_argument("base", choices=[bp.name for bp in base_products])
+    parser.add_argument("effects", nargs="+", help="required effects")
+    parser.add_argument("--forbid", action="append", default=[], help="effect the result must not have (repeatable)")
+    parser.add_argument("--level", default=AVAILABLE_LEVELS[-1], choices=AVAILABLE_LEVELS)
+    parser.add_argument("--shortest", action="store_true", help="fewest mixes rather than lowest cost")
+    parser.add_argument("--max-length", type=int, default=9)
+    args = parser.parse_args(argv)
+
+    bitmap = get_product_bitmap(args.level)
+    base = next(bp for bp in base_products if bp.name == args.base)
+    allowed = [p for i, p in enumerate(products) if (bitmap >> i) & 1]
+    try:
+        result = find_sequence_for_effects(base, allowed, args.effects, args.forbid, "length" if args.shortest else "cost", args.max_length)
+    except ValueError as e:
+        parser.error(str(e))
+    if result is None:
+        print(f"No sequence of at most {args.max_length} products reaches {', '.join(args.effects)}")
+        return 1
+    print(" + ".join(result["sequence"]))
+    print(f'cost {result["cost"]}, multiplier {result["total_multiplier"]:.2f}, net {result["net_benefit"]:.2f}')
+    print("effects:", ", ".join(result["effects"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,14 @@
-from precompute import load_precomputed
-from web_template import generate_static_html
-from config import AVAILABLE_LEVELS, BASE_PRODUCT_NAMES
+from precompute import load_precomputed, precomputed_fingerprint
+from web_template import generate_static_html, page_is_current
+from config import AVAILABLE_LEVELS, BASE_PRODUCT_NAMES, OUTPUT_HTML_FILE
 
 def main():
+    fingerprint = precomputed_fingerprint()
+    if page_is_current(fingerprint, AVAILABLE_LEVELS, BASE_PRODUCT_NAMES):
+        print(f"Static HTML file up to date: {OUTPUT_HTML_FILE}")
+        return
     precomputed = load_precomputed()
-    generate_static_html(precomputed, AVAILABLE_LEVELS, BASE_PRODUCT_NAMES)
+    generate_static_html(precomputed, AVAILABLE_LEVELS, BASE_PRODUCT_NAMES, fingerprint)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,151 @@
+"""
+Container shared by the project's memory-mapped binary files (results_store,
+state_graph, and through load_or_build the stored tables of deep and inverse).
+Layout (all integers little endian):
+
+    MAGIC (8 bytes) | header length (u32) | header (UTF-8 JSON) | padding to 8
+    | arrays, each padded to 8
+
+The header is the file's own JSON metadata plus "arrays": for each array its
+"offset" from the start of the file, "dtype" (a dtype string, or the field list
+of a structured dtype) and "shape". Every array starts on an 8 byte boundary, so
+readers can map them straight out of the file.
+"""
+import os
+import json
+import mmap
+import struct
+import threading
+import numpy as np
+
+ALIGN = 8
+
+def aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def write_mapped(path, magic, header, arrays):
+    """
+    Write header and arrays in the layout above, replacing path atomically. Each
+    value of arrays is an ndarray, or (dtype, shape, chunks) for an array written
+    piece by piece from an iterable of arrays. Returns the header as written.
+    The data goes through a temporary file private to this process and thread, so
+    concurrent writers of the same path never interleave.
+    """
+    specs = {}
+    for name, value in arrays.items():
+        dtype, shape = (value.dtype, list(value.shape)) if isinstance(value, np.ndarray) else (np.dtype(value[0]), list(value[1]))
+        specs[name] = dtype, shape
+    header = dict(header, arrays={})
+    # Offsets depend on the header's own length: lay out again until they settle.
+    encoded = None
+    while encoded != json.dumps(header).encode():
+        encoded = json.dumps(header).encode()
+        offset = aligned(len(magic) + 4 + len(encoded))
+        for name, (dtype, shape) in specs.items():
+            header["arrays"][name] = {"offset": offset, "dtype": dtype.descr if dtype.names else dtype.str, "shape": shape}
+            offset = aligned(offset + dtype.itemsize * int(np.prod(shape)))
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary, "wb") as f:
+            f.write(magic + struct.pack("<I", len(encoded)) + encoded)
+            for name, value in arrays.items():
+                f.write(b"\0" * (header["arrays"][name]["offset"] - f.tell()))
+                for chunk in ([value] if isinstance(value, np.ndarray) else value[2]):
+                    f.write(np.ascontiguousarray(chunk, dtype=specs[name][0]).tobytes())
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return header
+
+def _load_file(path, load):
+    """load(path) if path exists, marking it used for evict(); None otherwise."""
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return load(path)
+
+def evict(cache_dir, max_bytes, keep=None):
+    """
+    Remove the least recently used .bin files of cache_dir until the rest fit in
+    max_bytes, sparing keep. Processes that have a removed file mapped keep
+    reading it; on systems that refuse to remove an open file it stays.
+    """
+    files = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith(".bin") and path != keep:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files) + (os.path.getsize(keep) if keep and os.path.exists(keep) else 0)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def load_or_build(cache, key, cache_dir, load, build, max_bytes=None):
+    """
+    Cached object stored as a mapped file under a content hash `key`: from cache
+    (an lru.LRUCache of the last few used in this process), else load(path) of
+    cache_dir/key.bin, else build(), saved there with its save(path) and mapped
+    back unless cache_dir is None. For objects that take long to build and that any
+    later query or process can map instead of rebuilding. A build that gives up
+    returns None, which is neither stored nor cached. With max_bytes, each newly
+    saved file evicts the least recently used others until cache_dir fits.
+    """
+    def get():
+        path = None if cache_dir is None else os.path.join(cache_dir, key + ".bin")
+        value = _load_file(path, load)
+        if value is not None:
+            return value
+        value = build()
+        if path is not None and value is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            value.save(path)
+            if max_bytes is not None:
+                evict(cache_dir, max_bytes, keep=path)
+            # The mapping lives in the page cache, shared with other processes.
+            value = load(path)
+        return value
+
+    return cache.get_or_build(key, get)
+
+def load_stored(cache, key, cache_dir, load):
+    """The object load_or_build would return without building it: None if neither cache nor cache_dir has it."""
+    path = None if cache_dir is None else os.path.join(cache_dir, key + ".bin")
+    return cache.get_or_build(key, lambda: _load_file(path, load))
+
+class MappedFile:
+    """
+    Read-only mapping of a file in the layout above: header is the parsed JSON and
+    arrays maps each array's name to a view into the mapping. Drop every view
+    before close().
+    """
+    def __init__(self, path, magic, kind="mapped"):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(magic)] != magic:
+            self._map.close()
+            raise ValueError(f"{path} is not a {kind} file")
+        (length,) = struct.unpack_from("<I", self._map, len(magic))
+        self.header = json.loads(self._map[len(magic) + 4:len(magic) + 4 + length])
+        self.arrays = {}
+        for name, spec in self.header["arrays"].items():
+            dtype = np.dtype([tuple(field) for field in spec["dtype"]]) if isinstance(spec["dtype"], list) else np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"]))
+            self.arrays[name] = np.frombuffer(self._map, dtype=dtype, count=count, offset=spec["offset"]).reshape(spec["shape"])
+
+    def close(self):
+        self.arrays.clear()
+        self._map.close()
@@ -1,74 +1,203 @@
 import math
-from collections import deque
-from products import process_product_cached, compute_multiplier, bitmask_to_effects
+from array import array
+from collections import Counter
+from functools import partial
 from rules import products
+from transitions import get_transition_table
+from frontier import find_best_sequences_by_layer, make_candidate
+from reducers import CandidateReducer
+from instrumentation import record, record_cache
+from branch_bound import find_best_sequences_branch_bound
 
-def find_best_sequences_by_length_for_base_cost(base, supplemental_products, max_length=10, max_effects=8):
-    best_by_length = {}
-    all_candidates = []
-    initial_effects = process_product_cached(0, base)
-    initial_state = (initial_effects, (base,), 0, base.price * compute_multiplier(initial_effects), 0, -1)
-    queue = deque([initial_state])
-    visited = {(initial_effects, -1, 0): 0}
-    global_best_net = initial_state[3]
-    global_best_total_value = math.ceil(base.price * (1 + compute_multiplier(initial_effects)))
-    delta_max = max(base.price * compute_multiplier(process_product_cached(0, p)) - p.price for p in supplemental_products)
-    while queue:
-        stats["states_popped"] += 1
-        effects, seq, cost, net, drop_count, last_index = queue.popleft()
-        seq_names = [p.name for p in seq]
-        length = len(seq)
-        multiplier = compute_multiplier(effects)
-        current_net = base.price * multiplier - cost
-        total_value = math.ceil(base.price * (1 + multiplier))
-        all_candidates.append({
-            "sequence": seq_names,
-            "effects": bitmask_to_effects(effects),
-            "total_multiplier": multiplier,
-            "cost": cost,
-            "net_benefit": current_net,
-            "expected_total_value": total_value
-        })
-        if length not in best_by_length or current_net > best_by_length[length]["net_benefit"]:
-            best_by_length[length] = {
-                "sequence": seq_names,
-                "effects": bitmask_to_effects(effects),
-                "total_multiplier": multiplier,
-                "cost": cost,
-                "net_benefit": current_net,
-                "expected_total_value": total_value
-            }
+EMPTY_KEY = -1
+
+class StateStore:
+    """
+    Array-backed BFS states, one row per pushed state: transition table state id,
+    cost, drop count, last product index and the parent row. Rows are appended in
+    push order, so the store doubles as the BFS queue; sequences are rebuilt from
+    parent pointers only when asked for.
+    """
+    def __init__(self):
+        self.sid = array("l")
+        self.cost = array("q")
+        self.drop = array("b")
+        self.last = array("b")
+        self.length = array("H")
+        self.parent = array("l")
+
+    def __len__(self):
+        return len(self.sid)
+
+    def push(self, sid, cost, drop, last, parent):
+        self.sid.append(sid)
+        self.cost.append(cost)
+        self.drop.append(drop)
+        self.last.append(last)
+        self.length.append(self.length[parent] + 1 if parent >= 0 else 1)
+        self.parent.append(parent)
+        return len(self.sid) - 1
+
+    def names(self, label, base, supplemental_products):
+        names = []
+        while self.parent[label] >= 0:
+            names.append(supplemental_products[self.last[label]].name)
+            label = self.parent[label]
+        return [base.name] + names[::-1]
+
+class VisitedCosts:
+    """
+    Cheapest cost seen per integer state key, in an open-addressing hash table over
+    two flat int64 arrays (linear probing, kept at most half full).
+    """
+    def __init__(self, capacity=1 << 16):
+        self.keys = array("q", [EMPTY_KEY]) * capacity
+        self.costs = array("q", [0]) * capacity
+        self.mask = capacity - 1
+        self.size = 0
+
+    def _grow(self):
+        keys, costs = self.keys, self.costs
+        self.keys = array("q", [EMPTY_KEY]) * (2 * len(keys))
+        self.costs = array("q", [0]) * (2 * len(keys))
+        self.mask = mask = len(self.keys) - 1
+        for key, cost in zip(keys, costs):
+            if key != EMPTY_KEY:
+                slot = (key ^ key >> 15) & mask
+                while self.keys[slot] != EMPTY_KEY:
+                    slot = (slot + 1) & mask
+                self.keys[slot] = key
+                self.costs[slot] = cost
+
+    def improve(self, key, cost):
+        """Record cost if it is strictly cheaper than any seen for key."""
+        keys, mask = self.keys, self.mask
+        slot = (key ^ key >> 15) & mask
+        while True:
+            found = keys[slot]
+            if found == key:
+                if self.costs[slot] <= cost:
+                    return False
+                self.costs[slot] = cost
+                return True
+            if found == EMPTY_KEY:
+                break
+            slot = (slot + 1) & mask
+        keys[slot] = key
+        self.costs[slot] = cost
+        self.size += 1
+        if 2 * self.size > len(keys):
+            self._grow()
+        return True
+
+def scalar_candidates(base, supplemental_products, max_length=10, max_effects=8, table=None, store=None):
+    """
+    Breadth-first search over mixing sequences, yielding (label, sid, cost, length)
+    for every popped state in order, where label is the state's row in store.
+    Nothing is decoded here; see iter_candidates.
+    """
+    if table is None:
+        table = get_transition_table()
+    if store is None:
+        store = StateStore()
+    columns = [table.product_index[p.name] for p in supplemental_products]
+    prices = [p.price for p in supplemental_products]
+    initial_state = table.initial_state(base)
+    initial_multiplier = table.multiplier.item(initial_state)
+    width = len(supplemental_products) + 1
+    visited = VisitedCosts()
+    visited.improve(initial_state * width * 3, 0)
+    store.push(initial_state, 0, 0, -1, -1)
+    global_best_net = base.price * initial_multiplier
+    empty_state = table.state(0)
+    delta_max = max(base.price * table.multiplier.item(table.step(empty_state, c)) - p.price for c, p in zip(columns, supplemental_products))
+    improve, push = visited.improve, store.push
+    start = len(store) - 1
+    head = start
+    cache = table.hits, table.misses
+    pruned = Counter()
+    over_cap = drops = rejected = 0
+    try:
+        while head < len(store):
+            label = head
+            head += 1
+            sid, cost, drop_count, last_index, length = store.sid[label], store.cost[label], store.drop[label], store.last[label], store.length[label]
+            multiplier = table.multiplier.item(sid)
+            current_net = base.price * multiplier - cost
+            yield label, sid, cost, length
             global_best_net = max(global_best_net, current_net)
-            if total_value > global_best_total_value:
-                global_best_total_value = total_value
-        if length >= max_length or effects.bit_count() >= max_effects or current_net + (max_length - length) * delta_max < global_best_net:
-            continue
-        for i, prod in enumerate(supplemental_products):
-            if i == last_index:
-                continue
-            new_effects = process_product_cached(effects, prod)
-            if new_effects.bit_count() > max_effects:
+            if length >= max_length:
+                pruned["pruned_length"] += 1
                 continue
-            new_cost = cost + prod.price
-            new_multiplier = compute_multiplier(new_effects)
-            new_drop = drop_count + 1 if new_multiplier < multiplier else drop_count
-            if new_drop >= 3:
+            if table.effect_count[sid] >= max_effects:
+                pruned["pruned_effect_cap"] += 1
                 continue
-            new_net = base.price * new_multiplier - new_cost
-            key = (new_effects, i, new_drop)
-            if key in visited and visited[key] <= new_cost:
+            if current_net + (max_length - length) * delta_max < global_best_net:
+                pruned["pruned_bound"] += 1
                 continue
-            visited[key] = new_cost
-            queue.append((new_effects, seq + (prod,), new_cost, new_net, new_drop, i))
+            row = table.expand(sid).tolist()
+            for i, column in enumerate(columns):
+                if i == last_index:
+                    continue
+                new_sid = row[column]
+                if table.effect_count[new_sid] > max_effects:
+                    over_cap += 1
+                    continue
+                new_drop = drop_count + 1 if table.multiplier.item(new_sid) < multiplier else drop_count
+                if new_drop >= 3:
+                    drops += 1
+                    continue
+                new_cost = cost + prices[i]
+                if improve((new_sid * width + i + 1) * 3 + new_drop, new_cost):
+                    push(new_sid, new_cost, new_drop, i, label)
+                else:
+                    rejected += 1
+    finally:
+        pruned["pruned_effect_cap"] += over_cap
+        record(states_popped=head - start, states_pushed=len(store) - start - 1, pruned_drop=drops, pruned_visited=rejected, **pruned)
+        record_cache(table, cache)
+
+def iter_candidates(base, supplemental_products, max_length=10, max_effects=8, table=None):
+    """Every candidate the scalar search pops, decoded, for callers that want them all."""
+    if table is None:
+        table = get_transition_table()
+    store = StateStore()
+    for label, sid, cost, _ in scalar_candidates(base, supplemental_products, max_length, max_effects, table, store):
+        yield make_candidate(base, store.names(label, base, supplemental_products), table, sid, cost)
+
+def find_best_sequences_by_length_for_base_cost(base, supplemental_products, max_length=10, max_effects=8, table=None, top_k=1, sink=None):
+    """
+    Scalar BFS engine. Candidates stream through a CandidateReducer, so only the
+    winners are decoded; top_k > 1 adds a "top_by_length" ranking, and sink, when
+    given, is called with every decoded candidate as it is popped.
+    """
+    if table is None:
+        table = get_transition_table()
+    store = StateStore()
+    reducer = CandidateReducer(top_k)
+
+    def decode(label):
+        return make_candidate(base, store.names(label, base, supplemental_products), table, store.sid[label], store.cost[label])
+
+    for label, sid, cost, length in scalar_candidates(base, supplemental_products, max_length, max_effects, table, store):
+        multiplier = table.multiplier.item(sid)
+        reducer.add(label, length, base.price * multiplier - cost, math.ceil(base.price * (1 + multiplier)), cost)
+        if sink is not None:
+            sink(decode(label))
+    return reducer.result(decode)
 
-    best_total_value = max(all_candidates, key=lambda x: (x["expected_total_value"], -x["cost"]))
-    best_net = max(all_candidates, key=lambda x: x["net_benefit"])
-    return {
-        "best_value": best_total_value,
-        "best_net": best_net,
-        "by_length": best_by_length
-    }
+# Each engine takes (base, supplemental_products, max_length, max_effects). Only
+# "scalar" also takes top_k and sink (see find_best_sequences_by_length_for_base_cost).
+ENGINES = {
+    "scalar": find_best_sequences_by_length_for_base_cost,
+    "frontier": find_best_sequences_by_layer,
+    "exhaustive": partial(find_best_sequences_by_layer, bound=False),
+    "branch_bound": find_best_sequences_branch_bound,
+}
 
-def get_optimal_combo_for_bitmap(primary_product, product_bitmap, max_length=9, max_effects=8):
+def get_optimal_combo_for_bitmap(primary_product, product_bitmap, max_length=9, max_effects=8, engine="frontier", **options):
+    """Run engine over the products in product_bitmap; options (top_k, sink) go to the scalar engine only."""
     allowed_products = [p for i, p in enumerate(products) if (product_bitmap >> i) & 1]
-    return find_best_sequences_by_length_for_base_cost(primary_product, allowed_products, max_length, max_effects)
+    if options and engine != "scalar":
+        raise TypeError(f"engine {engine!r} takes no options {sorted(options)}")
+    return ENGINES[engine](primary_product, allowed_products, max_length, max_effects, **options)
@@ -1,45 +1,204 @@
 import os
 import json
-from config import PRECOMPUTED_FILE, AVAILABLE_LEVELS, product_unlock_levels
-from optimizer import get_optimal_combo_for_bitmap
-from rules import base_products
-
-def get_product_bitmap(player_level: str) -> int:
-    level_index = AVAILABLE_LEVELS.index(player_level)
-    bitmap = 0
-    for i, unlock_level in enumerate(product_unlock_levels):
-        if AVAILABLE_LEVELS.index(unlock_level) <= level_index:
-            bitmap |= (1 << i)
-    return bitmap
-
-def precompute_all():
+import time
+import hashlib
+from collections import Counter
+from config import PRECOMPUTED_FILE, PRECOMPUTED_BINARY_FILE, TRANSITIONS_FILE, TIMING_REPORT_FILE, PRECOMPUTE_CACHE_DIR, AVAILABLE_LEVELS
+from products import inputs_key
+from gamedata import load_game_data, unlock_bitmap as get_product_bitmap
+from instrumentation import timed
+
+# The rules, the search engines and numpy are imported where they are used, so
+# checking whether the grid is up to date (precomputed_fingerprint) reads only
+# the game data snapshot.
+
+def precompute_jobs():
+    """Map each distinct (base name, bitmap) job to the levels that share its result."""
+    game = load_game_data()
+    jobs = {}
+    for bp in game["bases"]:
+        for lvl in AVAILABLE_LEVELS:
+            jobs.setdefault((bp["name"], game["unlock_bitmaps"][lvl]), []).append(lvl)
+    return jobs
+
+def job_key(base_name, bitmap, max_length, max_effects, engine, game=None):
+    """
+    inputs_key of everything one job's result depends on: the base, the allowed
+    products in order, the search limits and the engine. Unlock levels only decide
+    which bitmaps exist. game is the game data snapshot, loaded if not given.
+    """
+    game = game or load_game_data()
+    base = next(bp for bp in game["bases"] if bp["name"] == base_name)
+    allowed = [p for i, p in enumerate(game["products"]) if (bitmap >> i) & 1]
+    return inputs_key(allowed, base, max_length=max_length, max_effects=max_effects, engine=engine)
+
+def job_keys(jobs, max_length=9, max_effects=8):
+    game = load_game_data()
+    return {job: job_key(job[0], job[1], max_length, max_effects, "frontier", game) for job in jobs}
+
+def grid_fingerprint(jobs, keys):
+    """Hash of the whole grid's inputs: every job's key and the levels it serves."""
+    data = [[name, bitmap, levels, keys[(name, bitmap)]] for (name, bitmap), levels in jobs.items()]
+    return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+def load_cached_job(key, cache_dir=PRECOMPUTE_CACHE_DIR):
+    path = os.path.join(cache_dir, key + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def store_cached_job(key, result, cache_dir=PRECOMPUTE_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + ".json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(result, f)
+    os.replace(path + ".tmp", path)
+
+def _init_worker():
+    from transitions import get_transition_table
+    get_transition_table(TRANSITIONS_FILE)
+
+def _format_result(result):
+    result["by_length"] = {str(k): v for k, v in result["by_length"].items()}
+    return result
+
+def _run_job(job):
+    """
+    Run one (base name, bitmap, max_length, max_effects) job. Returns the (base
+    name, bitmap) job with its result, the job's timing record and the transition
+    table rows it expanded (see TransitionTable.rows). The shared transition table
+    is trimmed once the job is done.
+    """
+    import numpy as np
+    from rules import base_products
+    from optimizer import get_optimal_combo_for_bitmap
+    from transitions import get_transition_table
+    table = get_transition_table()
+    expanded_before = table.expanded[:len(table)].copy()
+    base_name, bitmap, max_length, max_effects = job
+    base = next(bp for bp in base_products if bp.name == base_name)
+    with timed(stage="job", base=base_name, bitmap=bitmap) as timing:
+        result = get_optimal_combo_for_bitmap(base, bitmap, max_length, max_effects)
+    fresh = table.expanded[:len(table)].copy()
+    fresh[:len(expanded_before)] &= ~expanded_before
+    rows = table.rows(np.flatnonzero(fresh))
+    table.trim()
+    return ((base_name, bitmap), _format_result(result)), timing, rows
+
+def print_progress(done, total, job):
+    print(f"[{done}/{total}] {job[0]} bitmap {job[1]:#06x}", flush=True)
+
+def write_timing_report(timings, jobs, seconds, path=TIMING_REPORT_FILE):
+    """
+    JSON report of a precompute run: per-job wall time and search counters (with
+    the levels each job serves), slowest first, plus the run's totals.
+    """
+    totals = Counter()
+    for timing in timings:
+        totals.update(timing["counters"])
+        if timing["stage"] == "job":
+            timing["levels"] = jobs[(timing["base"], timing["bitmap"])]
+    report = {
+        "seconds": seconds,
+        "totals": dict(totals),
+        "timings": sorted(timings, key=lambda t: t["seconds"], reverse=True),
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    return report
+
+def precompute_all(workers=None, progress=print_progress, max_length=9, max_effects=8, cache_dir=PRECOMPUTE_CACHE_DIR):
+    """
+    Results for every base and level. Each distinct (base, bitmap) job is cached
+    in cache_dir under job_key, so only jobs whose inputs changed are recomputed.
+    """
+    import multiprocessing
+    from transitions import get_transition_table
+    from results_store import write_results
+    start = time.perf_counter()
+    jobs = precompute_jobs()
+    keys = job_keys(jobs, max_length, max_effects)
+    results = {}
+    for job, key in keys.items():
+        cached = load_cached_job(key, cache_dir)
+        if cached is not None:
+            results[job] = cached
+    missing = [(name, bitmap, max_length, max_effects) for name, bitmap in jobs if (name, bitmap) not in results]
+
+    timings = []
+    if missing:
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            _init_worker()
+            completed = map(_run_job, missing)
+        else:
+            pool = multiprocessing.Pool(min(workers, len(missing)), initializer=_init_worker)
+            completed = pool.imap_unordered(_run_job, missing)
+        # Jobs run in this process grow the shared table directly; rows from pool
+        # workers are merged into it, so the table is only loaded here when some arrive.
+        table = None
+        grown = 0
+        try:
+            for (job, result), timing, (masks, successors) in completed:
+                timings.append(timing)
+                store_cached_job(keys[job], result, cache_dir)
+                results[job] = result
+                if progress:
+                    progress(len(results), len(jobs), job)
+                if len(masks):
+                    table = get_transition_table(TRANSITIONS_FILE)
+                    grown += len(masks) if workers == 1 else table.merge_rows(masks, successors)
+        finally:
+            if workers != 1:
+                pool.close()
+                pool.join()
+        if grown:
+            table.save(TRANSITIONS_FILE)
+        write_timing_report(timings, jobs, time.perf_counter() - start)
+
     precomputed = {}
-    max_unlock_index = max(AVAILABLE_LEVELS.index(unlock) for unlock in product_unlock_levels)
-    
-    for bp in base_products:
-        precomputed[bp.name] = {}
-        result_at_max = None
+    for name in dict.fromkeys(name for name, _ in jobs):
+        precomputed[name] = {}
         for lvl in AVAILABLE_LEVELS:
-            lvl_index = AVAILABLE_LEVELS.index(lvl)
-            if lvl_index >= max_unlock_index and result_at_max is not None:
-                precomputed[bp.name][lvl] = result_at_max
-            else:
-                bitmap = get_product_bitmap(lvl)
-                result = get_optimal_combo_for_bitmap(bp, bitmap)
-                result["by_length"] = {str(k): v for k, v in result["by_length"].items()}
-                precomputed[bp.name][lvl] = result
-                if lvl_index == max_unlock_index:
-                    result_at_max = result
+            precomputed[name][lvl] = results[(name, get_product_bitmap(lvl))]
     with open(PRECOMPUTED_FILE, "w") as f:
         json.dump(precomputed, f)
+    write_results(precomputed, PRECOMPUTED_BINARY_FILE, grid_fingerprint(jobs, keys))
     return precomputed
 
 def load_precomputed():
-    if os.path.exists(PRECOMPUTED_FILE):
-        with open(PRECOMPUTED_FILE, "r") as f:
-            return json.load(f)
-    else:
-        return precompute_all()
+    """
+    Results for every base and level. Jobs come from the content-addressed cache
+    when their inputs are unchanged, so edits to rules, prices, multipliers or
+    unlock levels only recompute the jobs they affect.
+    """
+    store = open_precomputed()
+    try:
+        return store.to_dict()
+    finally:
+        store.close()
+
+def precomputed_fingerprint():
+    """grid_fingerprint of the default grid, computed from the game data snapshot alone."""
+    jobs = precompute_jobs()
+    return grid_fingerprint(jobs, job_keys(jobs))
+
+def open_precomputed():
+    """
+    Memory-mapped ResultsStore over the default grid. The binary file is reused
+    as long as its fingerprint matches the current inputs, so opening it parses
+    only its header; otherwise the grid is brought up to date first.
+    """
+    from results_store import open_results
+    fingerprint = precomputed_fingerprint()
+    if os.path.exists(PRECOMPUTED_BINARY_FILE):
+        store = open_results(PRECOMPUTED_BINARY_FILE)
+        if store.fingerprint == fingerprint:
+            return store
+        store.close()
+    precompute_all()
+    return open_results(PRECOMPUTED_BINARY_FILE)
 
 def filter_duplicates(precomputed):
     """
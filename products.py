@@ -1,3 +1,6 @@
+import copy
+import json
+import hashlib
 from config import multipliers
 
 effect_to_bit = {eff: 1 << i for i, eff in enumerate(multipliers)}
@@ -15,6 +18,10 @@ def compute_multiplier(mask):
         mask -= b
     return total
 
+def multiplier_cap(max_effects):
+    """Largest multiplier any mask with at most max_effects effects can have."""
+    return sum(sorted(multipliers.values(), reverse=True)[:max_effects])
+
 class Rule:
     def __init__(self, conditions, not_conditions, action, target, new_effect):
         self.cond_mask = sum(effect_to_bit[c] for c in conditions)
@@ -53,11 +60,38 @@ class Product:
                 result = candidate
         return result
 
-memo_process_product = {}
-def process_product_cached(effects, product):
-    key = (effects, id(product))
-    if key in memo_process_product:
-        return memo_process_product[key]
-    res = product.process(effects)
-    memo_process_product[key] = res
-    return res
\ No newline at end of file
+def product_spec(product):
+    """Everything about a product that decides its transitions, as JSON-able data."""
+    rules = [[r.cond_mask, r.not_cond_mask, r.action, r.target_bit, r.new_effect_bit] for r in product.rules]
+    return [product.name, product.default_effect, product.default_effect_position, rules]
+
+def with_price(product, prices):
+    """product, or a copy of it with its price from prices (name -> price) when prices names it."""
+    if product.name not in prices:
+        return product
+    product = copy.copy(product)
+    product.price = prices[product.name]
+    return product
+
+def priced_spec(product):
+    """product_spec plus the price, of a Product or of a game data snapshot entry (see gamedata)."""
+    if isinstance(product, dict):
+        return product["spec"] + [product["price"]]
+    return product_spec(product) + [product.price]
+
+def inputs_key(products, base=None, prices=True, **fields):
+    """
+    Content hash of the game inputs a stored object depends on: the multipliers in
+    effect bit order, the products in order and the base, each as product_spec
+    plus its price (spec alone if prices is False), and the caller's own `fields`.
+    Products and snapshot entries hash alike, so every cache keyed this way sees
+    the same change to the rules or prices.
+    """
+    def spec(product):
+        if prices:
+            return priced_spec(product)
+        return product["spec"] if isinstance(product, dict) else product_spec(product)
+    data = {"multipliers": list(multipliers.items()), "products": [spec(p) for p in products], **fields}
+    if base is not None:
+        data["base"] = spec(base)
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
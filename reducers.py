@@ -0,0 +1,49 @@
+import heapq
+
+class CandidateReducer:
+    """
+    Streaming replacement for collecting every candidate and scanning it at the end.
+    Candidates arrive as an opaque ref plus their scores; only the running best_value,
+    best_net and per-length top_k refs are kept, and decode(ref) turns a ref into a
+    result dict once, for the winners only, so refs must be hashable. Ties keep the
+    earliest candidate, like max().
+    """
+    def __init__(self, top_k=1):
+        self.top_k = top_k
+        self.count = 0
+        self.best_value = None
+        self.best_net = None
+        self.by_length = {}
+
+    def add(self, ref, length, net, value, cost):
+        order = -self.count
+        self.count += 1
+        if self.best_value is None or (value, -cost) > self.best_value[0]:
+            self.best_value = ((value, -cost), ref)
+        if self.best_net is None or net > self.best_net[0]:
+            self.best_net = (net, ref)
+        heap = self.by_length.setdefault(length, [])
+        entry = (net, order, ref)
+        if len(heap) < self.top_k:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+
+    def result(self, decode):
+        decoded = {}
+
+        def candidate(ref):
+            if ref not in decoded:
+                decoded[ref] = decode(ref)
+            return decoded[ref]
+
+        ranked = {length: [ref for _, _, ref in sorted(heap, key=lambda e: e[:2], reverse=True)]
+                  for length, heap in sorted(self.by_length.items())}
+        result = {
+            "best_value": candidate(self.best_value[1]),
+            "best_net": candidate(self.best_net[1]),
+            "by_length": {length: candidate(refs[0]) for length, refs in ranked.items()}
+        }
+        if self.top_k > 1:
+            result["top_by_length"] = {length: [candidate(ref) for ref in refs] for length, refs in ranked.items()}
+        return result
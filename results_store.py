@@ -0,0 +1,156 @@
+"""
+Binary layout of a results file, in the container of mapped_file.py:
+
+    MAGIC (8 bytes) | header length (u32) | header (UTF-8 JSON) | padding to 8
+    | index | results | combos | sequences
+
+The header holds the interned tables ("bases", "levels", "names", "effects"),
+"max_length", an optional "fingerprint" of the inputs, and the "arrays" table of
+offsets, dtypes and shapes. Arrays:
+
+    index      i4[bases, levels]            result record of each (base, level)
+    results    i4[records, 2 + max_length]  best_value, best_net and by_length
+                                            1..max_length combo ids (-1 if absent)
+    combos     COMBO_DTYPE[combos]          one row per distinct combo
+    sequences  u2[...]                      name ids of every combo's sequence,
+                                            combo i at sequence_start,
+                                            sequence_length entries
+
+Identical combos and identical result records are stored once, so levels past
+the last unlock cost one index entry each. Effects are bitmasks over "effects".
+"""
+import json
+import numpy as np
+from config import multipliers
+from mapped_file import write_mapped, MappedFile
+
+MAGIC = b"MIXRES01"
+
+COMBO_DTYPE = np.dtype([
+    ("sequence_start", "<i4"),
+    ("sequence_length", "<i4"),
+    ("effects", "<u8"),
+    ("total_multiplier", "<f8"),
+    ("cost", "<i8"),
+    ("net_benefit", "<f8"),
+    ("expected_total_value", "<i8"),
+])
+
+def _combo_row(combo, name_id, effect_bit, sequences):
+    ids = [name_id[n] for n in combo["sequence"]]
+    start = len(sequences)
+    sequences.extend(ids)
+    mask = 0
+    for effect in combo["effects"]:
+        mask |= effect_bit[effect]
+    return (start, len(ids), mask, combo["total_multiplier"], combo["cost"], combo["net_benefit"], combo["expected_total_value"])
+
+def write_results(precomputed, path, fingerprint=None):
+    """Write a precomputed {base: {level: result}} grid in the binary layout above."""
+    bases = list(precomputed)
+    levels = list(dict.fromkeys(level for by_level in precomputed.values() for level in by_level))
+    effects = list(multipliers)
+    effect_bit = {effect: 1 << i for i, effect in enumerate(effects)}
+    names = list(dict.fromkeys(
+        name
+        for by_level in precomputed.values() for result in by_level.values()
+        for combo in [result["best_value"], result["best_net"], *result["by_length"].values()]
+        for name in combo["sequence"]
+    ))
+    name_id = {name: i for i, name in enumerate(names)}
+    max_length = max((int(length) for by_level in precomputed.values() for result in by_level.values() for length in result["by_length"]), default=0)
+
+    combo_id, combo_rows, sequences = {}, [], []
+    record_id, records = {}, []
+    index = np.full((len(bases), len(levels)), -1, dtype="<i4")
+
+    def intern_combo(combo):
+        key = json.dumps(combo, sort_keys=True)
+        if key not in combo_id:
+            combo_id[key] = len(combo_rows)
+            combo_rows.append(_combo_row(combo, name_id, effect_bit, sequences))
+        return combo_id[key]
+
+    for b, base in enumerate(bases):
+        for l, level in enumerate(levels):
+            result = precomputed[base].get(level)
+            if result is None:
+                continue
+            record = [intern_combo(result["best_value"]), intern_combo(result["best_net"])] + [-1] * max_length
+            for length, combo in result["by_length"].items():
+                record[1 + int(length)] = intern_combo(combo)
+            record = tuple(record)
+            if record not in record_id:
+                record_id[record] = len(records)
+                records.append(record)
+            index[b, l] = record_id[record]
+
+    arrays = {
+        "index": index,
+        "results": np.array(records, dtype="<i4").reshape(len(records), 2 + max_length),
+        "combos": np.array(combo_rows, dtype=COMBO_DTYPE),
+        "sequences": np.array(sequences, dtype="<u2"),
+    }
+    header = {"bases": bases, "levels": levels, "names": names, "effects": effects, "max_length": max_length, "fingerprint": fingerprint}
+    write_mapped(path, MAGIC, header, arrays)
+
+class ResultsStore:
+    """
+    Read-only view of a results file. The file is memory-mapped and only the small
+    header is parsed up front; lookup(base, level) decodes a single result.
+    """
+    def __init__(self, path):
+        self._file = MappedFile(path, MAGIC, "results")
+        header = self._file.header
+        self.bases = header["bases"]
+        self.levels = header["levels"]
+        self.names = header["names"]
+        self.effects = header["effects"]
+        self.max_length = header["max_length"]
+        self.fingerprint = header.get("fingerprint")
+        self._base_index = {name: i for i, name in enumerate(self.bases)}
+        self._level_index = {name: i for i, name in enumerate(self.levels)}
+        for name, array in self._file.arrays.items():
+            setattr(self, name, array)
+
+    def combo(self, combo_id):
+        row = self.combos[combo_id]
+        start = int(row["sequence_start"])
+        ids = self.sequences[start:start + int(row["sequence_length"])].tolist()
+        mask = int(row["effects"])
+        return {
+            "sequence": [self.names[i] for i in ids],
+            "effects": [effect for bit, effect in enumerate(self.effects) if mask >> bit & 1],
+            "total_multiplier": float(row["total_multiplier"]),
+            "cost": int(row["cost"]),
+            "net_benefit": float(row["net_benefit"]),
+            "expected_total_value": int(row["expected_total_value"]),
+        }
+
+    def lookup(self, base, level):
+        """The result for (base, level) in precompute's JSON schema, or None."""
+        b, l = self._base_index.get(base), self._level_index.get(level)
+        if b is None or l is None or self.index[b, l] < 0:
+            return None
+        record = self.results[self.index[b, l]].tolist()
+        return {
+            "best_value": self.combo(record[0]),
+            "best_net": self.combo(record[1]),
+            "by_length": {str(length): self.combo(c) for length, c in enumerate(record[2:], start=1) if c >= 0},
+        }
+
+    def to_dict(self):
+        """The whole {base: {level: result}} grid, decoded."""
+        grid = {}
+        for base in self.bases:
+            results = {level: self.lookup(base, level) for level in self.levels}
+            grid[base] = {level: result for level, result in results.items() if result is not None}
+        return grid
+
+    def close(self):
+        for name in ("index", "results", "combos", "sequences"):
+            self.__dict__.pop(name, None)
+        self._file.close()
+
+def open_results(path):
+    return ResultsStore(path)
@@ -0,0 +1,88 @@
+from products import effect_to_bit
+
+def product_source(product, name="process"):
+    """
+    Python source for a function equivalent to product.process, with the rule
+    masks inlined as constants and the action dispatch resolved up front.
+    """
+    lines = [f"def {name}(effects, max_effects=8):", "    result = effects"]
+    default_bit = effect_to_bit[product.default_effect] if product.default_effect else 0
+    if default_bit and product.default_effect_position == "before":
+        lines += [
+            f"    result |= {default_bit}",
+            "    if result.bit_count() >= max_effects:",
+            "        return result",
+        ]
+    for rule in product.rules:
+        if rule.action == "replace":
+            candidate = f"(result & {~rule.target_bit}) | {rule.new_effect_bit}"
+        elif rule.action == "add":
+            candidate = f"result | {rule.new_effect_bit}"
+        else:
+            continue
+        if not rule.cond_mask:
+            test = "True"
+        elif rule.cond_mask & (rule.cond_mask - 1):
+            test = f"(result & {rule.cond_mask}) == {rule.cond_mask}"
+        else:
+            test = f"result & {rule.cond_mask}"
+        if rule.not_cond_mask:
+            test += f" and not result & {rule.not_cond_mask}"
+        lines += [
+            f"    if {test}:",
+            f"        candidate = {candidate}",
+            "        if candidate.bit_count() <= max_effects:",
+            "            result = candidate",
+        ]
+    if default_bit and product.default_effect_position == "after":
+        lines += [
+            f"    candidate = result | {default_bit}",
+            "    if candidate.bit_count() <= max_effects:",
+            "        result = candidate",
+        ]
+    lines.append("    return result")
+    return "\n".join(lines) + "\n"
+
+def compile_product(product):
+    """Specialized evaluator for one product: f(effects, max_effects=8) -> effects."""
+    namespace = {}
+    exec(compile(product_source(product), f"<rules {product.name}>", "exec"), namespace)
+    return namespace["process"]
+
+def compile_products(product_list):
+    return [compile_product(p) for p in product_list]
+
+def check_equivalence(product_list=None, roots=None, max_effects=8, depth=None):
+    """
+    Walk every mask reachable from the roots' initial masks within `depth` mixes
+    (any number if None) with the interpreter (Product.process), comparing each step
+    against the compiled evaluators. Returns the number of masks checked and the
+    mismatches as (product, mask, expected, got).
+    """
+    from rules import products, base_products
+    product_list = products if product_list is None else product_list
+    roots = base_products if roots is None else roots
+    evaluators = compile_products(product_list)
+    seen = {b.process(0, max_effects) for b in roots}
+    frontier = list(seen)
+    mismatches = []
+    while frontier and depth != 0:
+        depth = None if depth is None else depth - 1
+        reached = []
+        for mask in frontier:
+            for product, evaluate in zip(product_list, evaluators):
+                expected = product.process(mask, max_effects)
+                got = evaluate(mask, max_effects)
+                if got != expected:
+                    mismatches.append((product.name, mask, expected, got))
+                if expected not in seen:
+                    seen.add(expected)
+                    reached.append(expected)
+        frontier = reached
+    return len(seen), mismatches
+
+if __name__ == "__main__":
+    checked, mismatches = check_equivalence()
+    for mismatch in mismatches[:20]:
+        print(*mismatch)
+    print(f"{checked} masks, {len(mismatches)} mismatches")
@@ -0,0 +1,77 @@
+"""
+Best sequences for a batch of price scenarios over one unlock bitmap.
+
+This is one search per scenario, not a re-optimization from a shared structure:
+each distinct (base, prices) pair runs the default frontier engine, the one
+precompute and the page use, over copies of the bases and products with the
+scenario's prices, so its results are what that engine gives under those prices.
+The transition table does not depend on prices, so every run after the first
+finds its rows already expanded.
+"""
+import sys
+import json
+import argparse
+from config import AVAILABLE_LEVELS, TRANSITIONS_FILE
+from rules import base_products, products
+from products import with_price
+from frontier import find_best_sequences_by_layer
+from precompute import get_product_bitmap
+from transitions import get_transition_table
+
+def solve_scenarios(bitmap, scenarios, max_length=9, max_effects=8, bases=None, table=None):
+    """
+    Results for a batch of scenarios, each {"prices": {name: price}} over products
+    and bases (missing names keep their current price). Returns one
+    {base: {"best_value", "best_net", "by_length"}} per scenario.
+    """
+    if table is None:
+        table = get_transition_table()
+    allowed = [p for i, p in enumerate(products) if (bitmap >> i) & 1]
+    solved = {}
+    results = []
+    for scenario in scenarios:
+        prices = scenario.get("prices", {})
+        result = {}
+        for base in bases or base_products:
+            priced_base = with_price(base, prices)
+            priced = [with_price(p, prices) for p in allowed]
+            key = (base.name, priced_base.price, tuple(p.price for p in priced))
+            if key not in solved:
+                try:
+                    solved[key] = find_best_sequences_by_layer(priced_base, priced, max_length, max_effects, table)
+                finally:
+                    table.trim()
+            result[base.name] = solved[key]
+        results.append(result)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Best sequences for a batch of price scenarios at one level.")
+    parser.add_argument("scenarios", help='JSON list of {"prices": {product or base name: price}}')
+    parser.add_argument("--level", default=AVAILABLE_LEVELS[-1], choices=AVAILABLE_LEVELS)
+    parser.add_argument("--max-length", type=int, default=9)
+    parser.add_argument("--max-effects", type=int, default=8)
+    parser.add_argument("--output", help="write results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+    names = {p.name for p in products} | {bp.name for bp in base_products}
+    for scenario in scenarios:
+        unknown = set(scenario.get("prices", {})) - names
+        if unknown:
+            parser.error(f"unknown products in prices {sorted(unknown)}")
+        if any(not isinstance(price, int) or isinstance(price, bool) or price < 0 for price in scenario.get("prices", {}).values()):
+            parser.error("prices must be non-negative integers")
+    results = solve_scenarios(get_product_bitmap(args.level), scenarios, args.max_length, args.max_effects,
+                              table=get_transition_table(TRANSITIONS_FILE))
+    output = json.dumps([dict(scenario, results=result) for scenario, result in zip(scenarios, results)], indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import math
+import time
+import queue
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import TRANSITIONS_FILE
+from rules import base_products, products
+from products import with_price
+from optimizer import ENGINES
+from anytime import Budget, anytime_search
+from deep import get_suffix_tables
+from transitions import get_transition_table
+from lru import LRUCache
+
+DEFAULT_TIMEOUT = 30.0
+MAX_LENGTH_LIMIT = 12
+# branch_bound runs as an anytime search over stored suffix tables (see deep.py),
+# which allows longer sequences, for the share of the time limit left after
+# loading the tables and replying.
+DEEP_MAX_LENGTH_LIMIT = 20
+DEEP_SEARCH_SHARE = 0.8
+# Workers are started from a threaded server; forking a process that holds other
+# threads' locks can deadlock the child, so they are spawned fresh instead.
+_context = multiprocessing.get_context("spawn")
+
+def parse_query(payload):
+    """
+    Validate a request body and normalize it to a hashable query:
+    (base, allowed product names in table order, max_length, max_effects, engine,
+    sorted price overrides). Products come from "bitmap" (over rules.products) or
+    "products" (names); "prices" maps product or base names to integer prices, as
+    the engines keep costs integral. branch_bound allows max_length up to
+    DEEP_MAX_LENGTH_LIMIT, the other engines up to MAX_LENGTH_LIMIT.
+    """
+    base_names = {bp.name for bp in base_products}
+    product_names = [p.name for p in products]
+    base = payload.get("base")
+    if base not in base_names:
+        raise ValueError(f"unknown base {base!r}")
+    if "products" in payload:
+        unknown = set(payload["products"]) - set(product_names)
+        if unknown:
+            raise ValueError(f"unknown products {sorted(unknown)}")
+        allowed = tuple(name for name in product_names if name in payload["products"])
+    elif "bitmap" in payload:
+        bitmap = int(payload["bitmap"], 0) if isinstance(payload["bitmap"], str) else int(payload["bitmap"])
+        if not 0 <= bitmap < 1 << len(product_names):
+            raise ValueError(f"bitmap must be in 0..{(1 << len(product_names)) - 1}")
+        allowed = tuple(name for i, name in enumerate(product_names) if (bitmap >> i) & 1)
+    else:
+        raise ValueError("give either bitmap or products")
+    if not allowed:
+        raise ValueError("no products allowed")
+    max_length = int(payload.get("max_length", 9))
+    max_effects = int(payload.get("max_effects", 8))
+    engine = payload.get("engine", "frontier")
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}")
+    length_limit = DEEP_MAX_LENGTH_LIMIT if engine == "branch_bound" else MAX_LENGTH_LIMIT
+    if not 1 <= max_length <= length_limit or not 1 <= max_effects <= 8:
+        raise ValueError(f"max_length must be in 1..{length_limit} for engine {engine!r} and max_effects in 1..8")
+    prices = payload.get("prices", {})
+    unknown = set(prices) - base_names - set(product_names)
+    if unknown:
+        raise ValueError(f"unknown products in prices {sorted(unknown)}")
+    if any(not isinstance(price, int) or isinstance(price, bool) or price < 0 for price in prices.values()):
+        raise ValueError("prices must be non-negative integers")
+    prices = tuple(sorted(prices.items()))
+    return base, allowed, max_length, max_effects, engine, prices
+
+def parse_timeout(payload, limit):
+    """The request's own "timeout" in seconds, capped at the server's limit."""
+    timeout = float(payload.get("timeout", limit))
+    if not math.isfinite(timeout) or timeout <= 0:
+        raise ValueError("timeout must be a positive number of seconds")
+    return min(timeout, limit)
+
+class QueryError(ValueError):
+    """A valid query the worker cannot run as asked; the client gets a 400."""
+
+def run_query(query, seconds=None):
+    """
+    Run one normalized query in a worker, with price overrides applied to copies
+    of the products, and trim the worker's transition table afterwards.
+    branch_bound needs stored suffix tables (QueryError otherwise) and searches for
+    at most `seconds`; its result says whether it is "complete".
+    """
+    base_name, allowed, max_length, max_effects, engine, prices = query
+    prices = dict(prices)
+    base = with_price(next(bp for bp in base_products if bp.name == base_name), prices)
+    supplemental = [with_price(p, prices) for p in products if p.name in allowed]
+    start = time.perf_counter()
+    table = get_transition_table()
+    try:
+        if engine == "branch_bound":
+            budget = Budget(seconds)
+            if get_suffix_tables(table, base, supplemental, max_effects, max_length, build=False) is None:
+                raise QueryError(f"no stored suffix tables for engine {engine!r} at these products and prices; "
+                                 f"store them with deep.py or use engine 'frontier'")
+            result = anytime_search(base, supplemental, max_length, max_effects, budget, table)
+        else:
+            result = ENGINES[engine](base, supplemental, max_length, max_effects)
+    finally:
+        table.trim()
+    result["by_length"] = {str(k): v for k, v in result["by_length"].items()}
+    return result, time.perf_counter() - start
+
+def _init_worker():
+    get_transition_table(TRANSITIONS_FILE)
+
+class SearchError(Exception):
+    """A search failed inside its worker; the message names the original error, status is the HTTP status to answer with."""
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+def _serve(conn):
+    _init_worker()
+    while True:
+        try:
+            query, seconds = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, run_query(query, seconds)))
+        except QueryError as e:
+            conn.send((False, (str(e), 400)))
+        except Exception as e:
+            conn.send((False, (f"{type(e).__name__}: {e}", 500)))
+
+class SearchWorker:
+    """One search process with a warm transition table, fed queries over a pipe."""
+    def __init__(self):
+        self.conn, child = _context.Pipe()
+        self.process = _context.Process(target=_serve, args=(child,), daemon=True)
+        self.process.start()
+        child.close()
+
+    def run(self, query, timeout):
+        """
+        (result, seconds) of run_query(query); TimeoutError if it takes longer than
+        timeout. Anytime searches get DEEP_SEARCH_SHARE of the timeout.
+        """
+        self.conn.send((query, DEEP_SEARCH_SHARE * timeout))
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"search did not finish within {timeout}s")
+        ok, value = self.conn.recv()
+        if not ok:
+            raise SearchError(*value)
+        return value
+
+    def close(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class QueryServer(ThreadingHTTPServer):
+    """
+    HTTP/JSON front end. Request threads only parse, consult the result cache and
+    wait; searches run in a fixed set of worker processes that keep their
+    transition tables warm between requests, so at most `workers` searches run at
+    once and a slow search never blocks the others. Distinct searches beyond that
+    wait for a free worker, up to max_pending in all, past which requests get a
+    503. A search that outlives the server's time limit has its worker killed and
+    replaced; a request with a shorter limit of its own gets a 504 while the
+    search runs on, and its result is still cached for the next identical query.
+    Branch and bound queries stop themselves within the time limit instead, with
+    the best found so far; only complete results are cached.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, timeout=DEFAULT_TIMEOUT, cache_size=1024, verbose=False, max_pending=None):
+        super().__init__(address, QueryHandler)
+        self.verbose = verbose
+        workers = workers or os.cpu_count() or 1
+        self.workers = [SearchWorker() for _ in range(workers)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            self.idle.put(worker)
+        self.max_pending = max_pending or 4 * workers
+        self.results = LRUCache(cache_size)
+        self.request_timeout = timeout
+        self.pending = {}
+        self.restarts = 0
+        self.lock = threading.Lock()
+
+    def submit(self, query):
+        """
+        Future of query's (result, seconds), shared by concurrent identical
+        requests; None if max_pending distinct searches are already waiting or running.
+        """
+        with self.lock:
+            future = self.pending.get(query)
+            if future is None:
+                if len(self.pending) >= self.max_pending:
+                    return None
+                future = self.pending[query] = Future()
+                threading.Thread(target=self._search, args=(query, future), daemon=True).start()
+            return future
+
+    def _search(self, query, future):
+        worker = self.idle.get()
+        try:
+            value = worker.run(query, self.request_timeout)
+        except SearchError as e:
+            future.set_exception(e)
+        except Exception as e:
+            # Timed out or died: the process may still be busy, so replace it.
+            worker.close()
+            replacement = SearchWorker()
+            with self.lock:
+                self.workers[self.workers.index(worker)] = replacement
+                self.restarts += 1
+            worker = replacement
+            future.set_exception(e)
+        else:
+            if value[0].get("complete", True):
+                self.results.put(query, value)
+            future.set_result(value)
+        finally:
+            with self.lock:
+                self.pending.pop(query, None)
+            self.idle.put(worker)
+
+    def stats(self):
+        with self.lock:
+            running = len(self.workers) - self.idle.qsize()
+            return {"results": self.results.stats(), "workers": len(self.workers), "running": running,
+                    "queued": max(0, len(self.pending) - running), "restarts": self.restarts}
+
+    def server_close(self):
+        super().server_close()
+        with self.lock:
+            for worker in self.workers:
+                worker.close()
+
+class QueryHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self.send_json(200, self.server.stats())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/optimize":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            query = parse_query(payload)
+            timeout = parse_timeout(payload, self.server.request_timeout)
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        cached = self.server.results.get(query)
+        if cached is not None:
+            result, seconds = cached
+            self.send_json(200, {"result": result, "seconds": seconds, "cached": True})
+            return
+        future = self.server.submit(query)
+        if future is None:
+            self.send_json(503, {"error": "too many searches pending; retry later"})
+            return
+        try:
+            result, seconds = future.result(timeout=timeout)
+        except TimeoutError:
+            self.send_json(504, {"error": f"search did not finish within {timeout}s"})
+            return
+        except SearchError as e:
+            self.send_json(e.status, {"error": str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, {"result": result, "seconds": seconds, "cached": False})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ad-hoc optimizations over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, help="search processes (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="longest time a search runs or a request waits, in seconds")
+    parser.add_argument("--cache-size", type=int, default=1024, help="recent results kept in memory")
+    parser.add_argument("--max-pending", type=int, help="distinct searches waiting or running before requests get a 503 (default: 4 per worker)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+    server = QueryServer((args.host, args.port), args.workers, args.timeout, args.cache_size, args.verbose, args.max_pending)
+    print(f"Serving on http://{args.host}:{args.port} (POST /optimize, GET /stats)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Export of the reachable effect-mask graph for tools outside this project.
+
+Binary layout of a graph file, in the container of mapped_file.py:
+
+    MAGIC (8 bytes) | header length (u32) | header (UTF-8 JSON) | padding to 8
+    | masks | multiplier | successors | unlock_level
+
+The header holds "products" (names, in column order), "prices", "effects" (bit
+order) with their "multipliers", "levels" and "unlock_levels" (the level each
+product unlocks at), "bases" (name, price and root node of each base product),
+"max_effects", the "fingerprint" of the rules (transitions.rules_fingerprint)
+and the "arrays" table of offsets, dtypes and shapes. Arrays:
+
+    masks         u8[nodes]            effect bitmask of each node, ascending,
+                                       so a mask's node is a binary search away
+    multiplier    f8[nodes]            total multiplier of each node's effects
+    successors    i4[products, nodes]  successors[p, n] is the node reached by
+                                       mixing product p into node n
+    unlock_level  u1[products]         index into "levels" of each product's
+                                       unlock level, 255 if it has none
+
+Nodes are every mask reachable from the bases' initial masks through any
+sequence of products under the effect cap. Every node has exactly one successor
+per product, so each product's row of successors is a CSR adjacency whose
+indptr is 0, 1, ..., nodes and whose indices are the row itself.
+"""
+import os
+import sys
+import argparse
+import numpy as np
+from config import AVAILABLE_LEVELS, STATE_GRAPH_FILE, TRANSITIONS_FILE, product_unlock_levels, multipliers
+from rules import base_products, products
+from transitions import TransitionTable, get_transition_table, rules_fingerprint
+from mapped_file import write_mapped, MappedFile
+
+MAGIC = b"MIXGRF01"
+NEVER = 255
+
+def write_graph(table, path, roots=None):
+    """Write the graph reachable from roots (default: every base) in table's products in the layout above, walking a private copy of table."""
+    roots = list(base_products if roots is None else roots)
+    table = table.private()
+    states, _ = table.closure([table.initial_state(b) for b in roots])
+    order = states[np.argsort(table.masks[states], kind="stable")]
+    node = np.full(len(table), -1, dtype="<i4")
+    node[order] = np.arange(len(order), dtype="<i4")
+    columns = len(table.products)
+    level_of = dict(zip((p.name for p in products), product_unlock_levels))
+    unlock_levels = [level_of.get(p.name) for p in table.products]
+    header = {
+        "products": [p.name for p in table.products],
+        "prices": [p.price for p in table.products],
+        "effects": list(multipliers),
+        "multipliers": list(multipliers.values()),
+        "levels": AVAILABLE_LEVELS,
+        "unlock_levels": unlock_levels,
+        "bases": [{"name": b.name, "price": b.price, "node": int(node[table.initial_state(b)])} for b in roots],
+        "max_effects": table.max_effects,
+        "fingerprint": rules_fingerprint(table.products),
+    }
+    arrays = {
+        "masks": table.masks[order].astype("<u8"),
+        "multiplier": table.multiplier[order].astype("<f8"),
+        # One product at a time, so the export never holds a second copy of next_state.
+        "successors": ("<i4", [columns, len(order)], (node[table.next_state[order, p]] for p in range(columns))),
+        "unlock_level": np.array([NEVER if level is None else AVAILABLE_LEVELS.index(level) for level in unlock_levels], dtype="u1"),
+    }
+    write_mapped(path, MAGIC, header, arrays)
+    return len(order)
+
+class StateGraph:
+    """
+    Read-only view of a graph file. The file is memory-mapped and its arrays are
+    views into the mapping, so processes opening the same file share one copy.
+    """
+    def __init__(self, path):
+        self._file = MappedFile(path, MAGIC, "state graph")
+        header = self._file.header
+        self.products = header["products"]
+        self.prices = header["prices"]
+        self.effects = header["effects"]
+        self.effect_multipliers = header["multipliers"]
+        self.levels = header["levels"]
+        self.unlock_levels = header["unlock_levels"]
+        self.bases = header["bases"]
+        self.max_effects = header["max_effects"]
+        self.fingerprint = header["fingerprint"]
+        self.product_index = {name: i for i, name in enumerate(self.products)}
+        for name, array in self._file.arrays.items():
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def node(self, mask):
+        """Node of an effect mask; KeyError if the mask is not reachable."""
+        i = int(np.searchsorted(self.masks, np.uint64(mask)))
+        if i == len(self.masks) or int(self.masks[i]) != mask:
+            raise KeyError(mask)
+        return i
+
+    def column(self, product):
+        """Column of a product given by name or column."""
+        return self.product_index[product] if isinstance(product, str) else product
+
+    def root(self, base):
+        """Node of a base product's initial mask."""
+        return next(b["node"] for b in self.bases if b["name"] == base)
+
+    def step(self, node, product):
+        """Node reached by mixing product (a name or column) into node."""
+        column = self.column(product)
+        return int(self.successors[column, node])
+
+    def effect_names(self, node):
+        mask = int(self.masks[node])
+        return [effect for bit, effect in enumerate(self.effects) if mask >> bit & 1]
+
+    def adjacency(self, product):
+        """(indptr, indices) of a product's edges in CSR form; indices is a view into the file."""
+        column = self.column(product)
+        return np.arange(len(self) + 1, dtype=np.int64), self.successors[column]
+
+    def predecessors(self, product):
+        """(indptr, indices) in CSR form of the nodes that reach each node by mixing product."""
+        column = self.column(product)
+        targets = self.successors[column]
+        indices = np.argsort(targets, kind="stable").astype(np.int32)
+        indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(targets, minlength=len(self)), out=indptr[1:])
+        return indptr, indices
+
+    def unlocked(self, level):
+        """Columns of the products available at a level."""
+        limit = self.levels.index(level)
+        return [p for p, unlock in enumerate(self.unlock_level.tolist()) if unlock <= limit]
+
+    def close(self):
+        for name in ("masks", "multiplier", "successors", "unlock_level"):
+            self.__dict__.pop(name, None)
+        self._file.close()
+
+def open_graph(path=STATE_GRAPH_FILE):
+    return StateGraph(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the reachable effect-mask graph of every product as a memory-mappable file.")
+    parser.add_argument("--output", default=STATE_GRAPH_FILE)
+    parser.add_argument("--max-effects", type=int, default=8)
+    parser.add_argument("--transitions", default=TRANSITIONS_FILE, help="transition table to start from, if it exists")
+    args = parser.parse_args(argv)
+
+    table = get_transition_table(args.transitions)
+    if table.max_effects != args.max_effects:
+        table = TransitionTable(max_effects=args.max_effects)
+    nodes = write_graph(table, args.output)
+    print(f"{nodes} nodes x {len(table.products)} products written to {args.output} ({os.path.getsize(args.output)} bytes)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from rules import base_products, products
+from transitions import TransitionTable
+from frontier import find_best_sequences_by_layer
+from deep import SuffixTables
+from branch_bound import BranchBoundSearch
+from anytime import Budget, anytime_search
+
+# Street Rat I: Cuke, Donut, Banana, Paracetamol.
+BITMAP = 0x489
+
+@pytest.fixture(scope="module")
+def table():
+    return TransitionTable()
+
+def test_no_budget_still_returns_the_seed(table):
+    allowed = [p for i, p in enumerate(products) if (BITMAP >> i) & 1]
+    for base in base_products:
+        result = anytime_search(base, allowed, 12, 8, Budget(states=0), table)
+        seed = find_best_sequences_by_layer(base, allowed, 9, 8, table)
+        assert not result["complete"]
+        assert result["best_net"]["net_benefit"] >= seed["best_net"]["net_benefit"]
+        assert result["bound"] >= result["best_net"]["net_benefit"]
+
+def test_complete_search_is_exact(table):
+    allowed = [p for i, p in enumerate(products) if (BITMAP >> i) & 1]
+    for base in base_products:
+        result = anytime_search(base, allowed, 6, 8, Budget(), table)
+        search = BranchBoundSearch(base, allowed, 6, 8, table, suffix_tables=SuffixTables.build(table, base, allowed, 8, 5))
+        for _ in search.steps():
+            pass
+        exact = search.result()
+        assert result["complete"]
+        assert result["bound"] == pytest.approx(result["best_net"]["net_benefit"])
+        assert {length: combo["net_benefit"] for length, combo in result["by_length"].items()} == \
+            pytest.approx({length: combo["net_benefit"] for length, combo in exact["by_length"].items()})
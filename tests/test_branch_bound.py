@@ -0,0 +1,65 @@
+import math
+import pytest
+
+pytest.importorskip("numpy")
+
+from products import compute_multiplier
+from rules import base_products, products
+from transitions import TransitionTable
+from deep import SuffixTables
+from branch_bound import BranchBoundSearch
+
+# Street Rat I: Cuke, Donut, Banana, Paracetamol.
+BITMAP = 0x489
+
+def brute_force(base, allowed, max_length, max_effects):
+    """Best net per length and best (value, -cost) over every sequence the engines allow."""
+    by_length = {}
+    best_value = None
+
+    def visit(mask, multiplier, cost, length, last, drops):
+        nonlocal best_value
+        by_length[length] = max(by_length.get(length, -math.inf), base.price * multiplier - cost)
+        value = (math.ceil(base.price * (1 + multiplier)), -cost)
+        best_value = value if best_value is None else max(best_value, value)
+        if length >= max_length or mask.bit_count() >= max_effects:
+            return
+        for i, product in enumerate(allowed):
+            if i == last:
+                continue
+            new_mask = product.process(mask)
+            if new_mask.bit_count() > max_effects:
+                continue
+            new_multiplier = compute_multiplier(new_mask)
+            new_drops = drops + (new_multiplier < multiplier)
+            if new_drops < 3:
+                visit(new_mask, new_multiplier, cost + product.price, length + 1, i, new_drops)
+
+    mask = base.process(0)
+    visit(mask, compute_multiplier(mask), 0, 1, -1, 0)
+    return by_length, best_value
+
+@pytest.fixture(scope="module")
+def table():
+    return TransitionTable()
+
+@pytest.mark.parametrize("max_length, max_effects", [(6, 8), (5, 4)])
+@pytest.mark.parametrize("depth", ["limited", "whole"])
+def test_branch_bound_matches_brute_force(table, max_length, max_effects, depth):
+    allowed = [p for i, p in enumerate(products) if (BITMAP >> i) & 1]
+    for base in base_products:
+        tables = SuffixTables.build(table, base, allowed, max_effects, max_length - 1 if depth == "limited" else None)
+        search = BranchBoundSearch(base, allowed, max_length, max_effects, table, suffix_tables=tables)
+        for _ in search.steps():
+            pass
+        result = search.result()
+        by_length, best_value = brute_force(base, allowed, max_length, max_effects)
+        assert {length: combo["net_benefit"] for length, combo in result["by_length"].items()} == pytest.approx(by_length)
+        assert result["best_net"]["net_benefit"] == pytest.approx(max(by_length.values()))
+        assert (result["best_value"]["expected_total_value"], -result["best_value"]["cost"]) == best_value
+
+def test_tables_refuse_longer_searches(table):
+    allowed = [p for i, p in enumerate(products) if (BITMAP >> i) & 1]
+    tables = SuffixTables.build(table, base_products[0], allowed, 8, 3)
+    with pytest.raises(ValueError):
+        BranchBoundSearch(base_products[0], allowed, 5, 8, table, suffix_tables=tables)
@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from rules import base_products, products
+from transitions import TransitionTable
+from frontier import find_best_sequences_by_layer
+from optimizer import find_best_sequences_by_length_for_base_cost
+
+@pytest.fixture(scope="module")
+def table():
+    return TransitionTable()
+
+# Street Rat I and Hoodlum IV.
+@pytest.mark.parametrize("bitmap", [0x489, 0xcab])
+@pytest.mark.parametrize("max_length, max_effects", [(6, 8), (5, 4)])
+def test_frontier_matches_scalar(table, bitmap, max_length, max_effects):
+    allowed = [p for i, p in enumerate(products) if (bitmap >> i) & 1]
+    for base in base_products:
+        layered = find_best_sequences_by_layer(base, allowed, max_length, max_effects, table)
+        assert layered == find_best_sequences_by_length_for_base_cost(base, allowed, max_length, max_effects, table)
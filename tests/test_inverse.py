@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from rules import base_products, products
+from transitions import TransitionTable
+from inverse import ReachIndex
+
+# Street Rat I: Cuke, Donut, Banana, Paracetamol.
+BITMAP = 0x489
+MAX_LENGTH = 5
+
+def brute_force(base, allowed, max_length):
+    """Per reachable mask, (cost, mixes) minimizing cost first and (mixes, cost) minimizing mixes first."""
+    cheapest, shortest = {}, {}
+
+    def visit(mask, cost, mixes):
+        cheapest[mask] = min(cheapest.get(mask, (cost, mixes)), (cost, mixes))
+        shortest[mask] = min(shortest.get(mask, (mixes, cost)), (mixes, cost))
+        if mixes + 1 < max_length:
+            for product in allowed:
+                visit(product.process(mask), cost + product.price, mixes + 1)
+
+    visit(base.process(0), 0, 0)
+    return cheapest, shortest
+
+def replay(base, allowed, names):
+    by_name = {p.name: p for p in allowed}
+    assert names[0] == base.name
+    mask, cost = base.process(0), 0
+    for name in names[1:]:
+        mask, cost = by_name[name].process(mask), cost + by_name[name].price
+    return mask, cost
+
+@pytest.fixture(scope="module")
+def table():
+    return TransitionTable()
+
+def test_reach_index_matches_brute_force(table):
+    allowed = [p for i, p in enumerate(products) if (BITMAP >> i) & 1]
+    for base in base_products:
+        index = ReachIndex.build(base, allowed, MAX_LENGTH, table)
+        cheapest, shortest = brute_force(base, allowed, MAX_LENGTH)
+        masks = index.masks.tolist()
+        assert masks == sorted(cheapest)
+        for i, mask in enumerate(masks):
+            assert (int(index.cost[i]), int(index.cost_layer[i])) == cheapest[mask]
+            assert (int(index.length[i]), int(index.length_cost[i])) == shortest[mask]
+            # Parent chains rebuild a sequence with that mask and cost for both objectives.
+            for cost, depth in ((index.cost[i], index.cost_layer[i]), (index.length_cost[i], index.length[i])):
+                names = index.names(i, int(depth))
+                assert len(names) == depth + 1
+                assert replay(base, allowed, names) == (mask, cost)
+
+def test_query_picks_the_best_match(table):
+    allowed = [p for i, p in enumerate(products) if (BITMAP >> i) & 1]
+    base = base_products[0]
+    index = ReachIndex.build(base, allowed, MAX_LENGTH, table)
+    cheapest, shortest = brute_force(base, allowed, MAX_LENGTH)
+    for required in {mask & -mask for mask in cheapest} | set(cheapest):
+        matches = [mask for mask in cheapest if mask & required == required]
+        combo = index.query(required, objective="cost")
+        assert (combo["cost"], len(combo["sequence"]) - 1) == min(cheapest[mask] for mask in matches)
+        combo = index.query(required, objective="length")
+        assert (len(combo["sequence"]) - 1, combo["cost"]) == min(shortest[mask] for mask in matches)
@@ -0,0 +1,34 @@
+import os
+import pytest
+
+pytest.importorskip("numpy")
+
+from lru import LRUCache
+from mapped_file import load_or_build
+
+class Blob:
+    def __init__(self, size):
+        self.size = size
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(b"\0" * self.size)
+
+    @classmethod
+    def load(cls, path):
+        return cls(os.path.getsize(path))
+
+def test_load_or_build_evicts_least_recently_used(tmp_path):
+    cache_dir = str(tmp_path)
+    for i, key in enumerate(["a", "b"]):
+        load_or_build(LRUCache(4), key, cache_dir, Blob.load, lambda: Blob(100), max_bytes=250)
+        os.utime(tmp_path / f"{key}.bin", (i, i))
+    # Loading "a" again marks it used, so "b" is the one to go.
+    assert load_or_build(LRUCache(4), "a", cache_dir, Blob.load, lambda: pytest.fail("rebuilt a stored file")).size == 100
+    load_or_build(LRUCache(4), "c", cache_dir, Blob.load, lambda: Blob(100), max_bytes=250)
+    assert sorted(os.listdir(cache_dir)) == ["a.bin", "c.bin"]
+
+def test_failed_builds_are_not_stored(tmp_path):
+    cache = LRUCache(4)
+    assert load_or_build(cache, "a", str(tmp_path), Blob.load, lambda: None) is None
+    assert len(cache) == 0 and os.listdir(tmp_path) == []
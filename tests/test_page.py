@@ -0,0 +1,18 @@
+import os
+import shutil
+
+import gamedata
+from config import AVAILABLE_LEVELS, BASE_PRODUCT_NAMES, OUTPUT_DATA_DIR, OUTPUT_HTML_FILE
+from precompute import precomputed_fingerprint
+from web_template import page_is_current
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_tracked_page_is_current(tmp_path, monkeypatch):
+    # Only the tracked page, as in a clean checkout: no game data snapshot or results.
+    shutil.copy(os.path.join(ROOT, OUTPUT_HTML_FILE), tmp_path)
+    shutil.copytree(os.path.join(ROOT, OUTPUT_DATA_DIR), tmp_path / OUTPUT_DATA_DIR)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(gamedata, "_game_data", None)
+    assert page_is_current(precomputed_fingerprint(), AVAILABLE_LEVELS, BASE_PRODUCT_NAMES), \
+        "data/manifest.json is stale; run python main.py and commit index.html and data/"
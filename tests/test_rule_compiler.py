@@ -0,0 +1,33 @@
+import pytest
+from products import Product
+from rules import base_products, products, make_rules
+from rule_compiler import check_equivalence, compile_product
+
+# No product in rules.py adds its default effect before its rules; this one does,
+# and mixes replace and add rules with multi-effect, negated and empty conditions.
+BEFORE = Product("Synthetic Before", "Energizing", make_rules([
+    ("Munchies", [], "Munchies", "Calming"),
+    (["Energizing", "Calming"], ["Toxic"], "+", "Sneaky"),
+    ([], "Smelly", "+", "Refreshing"),
+    ("Paranoia", ["Focused", "Euphoric"], "Paranoia", "Focused"),
+    ("Energizing", [], "Energizing", "Balding"),
+]), default_effect_position="before", price=4)
+
+@pytest.mark.parametrize("max_effects", [8, 3])
+def test_compiled_rules_match_interpreter(max_effects):
+    checked, mismatches = check_equivalence(products + [BEFORE], base_products, max_effects, depth=3)
+    assert checked > len(base_products)
+    assert mismatches == []
+
+def test_default_effect_before_rules():
+    evaluate = compile_product(BEFORE)
+    roots = {base.process(0) for base in base_products}
+    assert any(BEFORE.process(mask) != mask for mask in roots)
+    for mask in roots:
+        for max_effects in range(1, 9):
+            assert evaluate(mask, max_effects) == BEFORE.process(mask, max_effects)
+
+def test_depth_bounds_the_walk():
+    shallow, _ = check_equivalence(products, base_products, depth=1)
+    deeper, _ = check_equivalence(products, base_products, depth=2)
+    assert len({base.process(0) for base in base_products}) < shallow < deeper
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from rules import base_products, products
+from transitions import TransitionTable, UNKNOWN
+from frontier import find_best_sequences_by_layer
+
+# Street Rat I and Hoodlum IV.
+BITMAPS = [0x489, 0xcab]
+
+def check_rows(table):
+    """Every expanded row leads where the product rules say, and state_of matches the masks."""
+    assert table.state_of == {mask: sid for sid, mask in enumerate(table.masks[:table.size].tolist())}
+    for sid in np.flatnonzero(table.expanded[:table.size]).tolist():
+        mask = int(table.masks[sid])
+        for column, product in enumerate(table.products):
+            assert int(table.masks[table.next_state[sid, column]]) == product.process(mask, table.max_effects)
+    unexpanded = ~table.expanded[:table.size]
+    assert (table.next_state[:table.size][unexpanded] == UNKNOWN).all()
+
+def test_trimmed_table_gives_untrimmed_results():
+    trimmed = TransitionTable(max_states=3000)
+    untrimmed = TransitionTable(max_states=None)
+    evicted = 0
+    for _ in range(2):
+        for bitmap in BITMAPS:
+            allowed = [p for i, p in enumerate(products) if (bitmap >> i) & 1]
+            for base in base_products:
+                result = find_best_sequences_by_layer(base, allowed, 6, 8, trimmed)
+                assert result == find_best_sequences_by_layer(base, allowed, 6, 8, untrimmed)
+                evicted += trimmed.trim()
+                assert len(trimmed) <= trimmed.max_states
+                check_rows(trimmed)
+    assert evicted > 0
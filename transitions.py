@@ -0,0 +1,265 @@
+import os
+import numpy as np
+from products import compute_multiplier, inputs_key
+from rule_compiler import compile_products
+from rules import products, base_products
+
+UNKNOWN = -1
+DEFAULT_MAX_STATES = 1 << 22
+TRIM_FRACTION = 0.75
+EXPAND_CHUNK = 4096
+
+def rules_fingerprint(product_list):
+    """inputs_key of the products without prices: equal fingerprints, equal transitions."""
+    return inputs_key(product_list, prices=False)
+
+class TransitionTable:
+    """
+    Dense transition table over effect masks. Every mask seen gets an integer
+    state id; next_state[state_id, product_index] holds the id reached by mixing
+    products[product_index] into that state, or UNKNOWN until the row is expanded.
+    Rows are expanded lazily, so the table only ever holds masks a search touched
+    (or that build() enumerated up front).
+
+    Searches hold on to state ids, so the table only shrinks when trim() is called
+    between queries: past max_states it evicts the states least recently expanded,
+    renumbers the rest and bumps `generation`, after which any state id kept from
+    before means nothing. hits, misses and evictions count row lookups.
+    """
+    def __init__(self, product_list=None, max_effects=8, capacity=1024, max_states=DEFAULT_MAX_STATES):
+        self.products = list(products if product_list is None else product_list)
+        self.product_index = {p.name: i for i, p in enumerate(self.products)}
+        self.evaluators = compile_products(self.products)
+        self.max_effects = max_effects
+        self.size = 0
+        self.state_of = {}
+        self.masks = np.zeros(capacity, dtype=np.uint64)
+        self.multiplier = np.zeros(capacity, dtype=np.float64)
+        self.effect_count = np.zeros(capacity, dtype=np.uint8)
+        self.next_state = np.full((capacity, len(self.products)), UNKNOWN, dtype=np.int32)
+        self.expanded = np.zeros(capacity, dtype=bool)
+        self.last_used = np.zeros(capacity, dtype=np.uint32)
+        self.max_states = max_states
+        self.queries = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return self.size
+
+    def _resize(self, capacity):
+        old = self.size
+        for name, fill in (("masks", 0), ("multiplier", 0), ("effect_count", 0), ("expanded", False), ("last_used", 0)):
+            arr = getattr(self, name)
+            resized = np.full(capacity, fill, dtype=arr.dtype)
+            resized[:old] = arr[:old]
+            setattr(self, name, resized)
+        resized = np.full((capacity, len(self.products)), UNKNOWN, dtype=np.int32)
+        resized[:old] = self.next_state[:old]
+        self.next_state = resized
+
+    def state(self, mask):
+        sid = self.state_of.get(mask)
+        if sid is None:
+            sid = self.size
+            if sid == len(self.masks):
+                self._resize(2 * len(self.masks))
+            self.masks[sid] = mask
+            self.last_used[sid] = self.queries
+            self.multiplier[sid] = compute_multiplier(mask)
+            self.effect_count[sid] = mask.bit_count()
+            self.state_of[mask] = sid
+            self.size += 1
+        return sid
+
+    def expand(self, sid):
+        self.last_used[sid] = self.queries
+        if self.expanded[sid]:
+            self.hits += 1
+        else:
+            self.misses += 1
+            mask = int(self.masks[sid])
+            row = [self.state(evaluate(mask, self.max_effects)) for evaluate in self.evaluators]
+            self.next_state[sid] = row
+            self.expanded[sid] = True
+        return self.next_state[sid]
+
+    def expand_many(self, sids, stop=None):
+        """
+        Expand every row of sids. stop, if given, is called before each
+        EXPAND_CHUNK rows still to expand; returns False if it ended the work early.
+        """
+        sids = np.asarray(sids)
+        self.last_used[sids] = self.queries
+        known = self.expanded[sids]
+        self.hits += int(known.sum())
+        missing = np.unique(sids[~known]).tolist()
+        for start in range(0, len(missing), EXPAND_CHUNK):
+            if stop is not None and stop():
+                return False
+            for sid in missing[start:start + EXPAND_CHUNK]:
+                self.expand(sid)
+        return True
+
+    def step(self, sid, product_index):
+        nxt = self.next_state[sid, product_index]
+        if nxt == UNKNOWN:
+            nxt = self.expand(sid)[product_index]
+        return int(nxt)
+
+    def initial_state(self, base):
+        return self.state(base.process(0, self.max_effects))
+
+    def closure(self, roots, columns=None, depth=None, stop=None):
+        """
+        States within `depth` mixes (any number if None) of the root state ids
+        through the given product columns (all if None), breadth first, expanding
+        rows as needed. Returns the states in BFS order and their distance from the
+        nearest root. If stop (see expand_many) ends the walk early, the farthest
+        level returned is the one whose rows were being expanded, and some of them
+        may still be unexpanded.
+        """
+        frontier = np.unique(np.asarray(roots, dtype=np.int64))
+        states = [frontier]
+        seen = np.zeros(len(self), dtype=bool)
+        seen[frontier] = True
+        while depth is None or len(states) <= depth:
+            if not self.expand_many(frontier, stop):
+                break
+            if len(seen) < len(self):
+                seen = np.concatenate([seen, np.zeros(len(self) - len(seen), dtype=bool)])
+            successors = self.next_state[frontier] if columns is None else self.next_state[frontier][:, columns]
+            fresh = np.zeros(len(seen), dtype=bool)
+            fresh[successors.ravel()] = True
+            frontier = np.flatnonzero(fresh & ~seen)
+            if len(frontier) == 0:
+                break
+            seen[frontier] = True
+            states.append(frontier)
+        distance = np.concatenate([np.full(len(s), d, dtype=np.int64) for d, s in enumerate(states)])
+        return np.concatenate(states), distance
+
+    def private(self):
+        """
+        An unbounded copy of this table, for walks as large as a whole closure: they
+        grow the copy instead of pushing this table past max_states until the next
+        trim(). A table without max_states is returned as is.
+        """
+        if self.max_states is None:
+            return self
+        n = self.size
+        table = TransitionTable(self.products, self.max_effects, capacity=max(1024, n), max_states=None)
+        for name in ("masks", "multiplier", "effect_count", "next_state", "expanded"):
+            getattr(table, name)[:n] = getattr(self, name)[:n]
+        table.size = n
+        table.state_of = dict(self.state_of)
+        return table
+
+    def build(self, roots=None, depth=None):
+        """Enumerate masks reachable from the base products' initial masks, breadth first."""
+        if roots is None:
+            roots = base_products
+        self.closure([self.initial_state(b) for b in roots], depth=depth)
+        return self
+
+    def rows(self, sids):
+        """Masks of the expanded rows sids and of their successors, for merge_rows in another process."""
+        return self.masks[sids], self.masks[self.next_state[sids]]
+
+    def merge_rows(self, masks, successors):
+        """Add expanded rows given as masks (see rows) that this table lacks; returns how many it lacked."""
+        sids = np.array([self.state(mask) for mask in masks.tolist()], dtype=np.int64)
+        lacking = ~self.expanded[sids]
+        sids, targets = sids[lacking], successors[lacking]
+        unique, inverse = np.unique(targets, return_inverse=True)
+        states = np.array([self.state(mask) for mask in unique.tolist()], dtype=np.int32)
+        self.next_state[sids] = states[inverse].reshape(targets.shape)
+        self.expanded[sids] = True
+        return len(sids)
+
+    def trim(self):
+        """
+        Mark the end of a query. If the table has outgrown max_states, keep the
+        TRIM_FRACTION of max_states states expanded most recently, renumbered in
+        their old order; rows that led to an evicted state are unexpanded again.
+        Returns the number of states evicted.
+        """
+        self.queries += 1
+        n = self.size
+        if self.max_states is None or n <= self.max_states:
+            return 0
+        keep = np.sort(np.argsort(-self.last_used[:n].astype(np.int64), kind="stable")[:int(self.max_states * TRIM_FRACTION)])
+        # One spare slot past n, so UNKNOWN (-1) maps to itself.
+        renumber = np.full(n + 1, UNKNOWN, dtype=np.int32)
+        renumber[keep] = np.arange(len(keep), dtype=np.int32)
+        rows = self.next_state[keep]
+        lost = ((renumber[rows] == UNKNOWN) & (rows != UNKNOWN)).any(axis=1)
+        rows = renumber[rows]
+        rows[lost] = UNKNOWN
+        expanded = self.expanded[keep] & ~lost
+        for name in ("masks", "multiplier", "effect_count", "last_used"):
+            arr = getattr(self, name)
+            arr[:len(keep)] = arr[keep]
+        self.next_state[:len(keep)] = rows
+        self.expanded[:len(keep)] = expanded
+        self.size = len(keep)
+        self._resize(max(1024, self.max_states))
+        self.state_of = {mask: sid for sid, mask in enumerate(self.masks[:self.size].tolist())}
+        self.evictions += n - self.size
+        self.generation += 1
+        return n - self.size
+
+    def stats(self):
+        return {"size": self.size, "max_states": self.max_states, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "generation": self.generation}
+
+    def save(self, path):
+        n = self.size
+        np.savez_compressed(
+            path,
+            products=np.array([p.name for p in self.products]),
+            fingerprint=np.array(rules_fingerprint(self.products)),
+            max_effects=np.array(self.max_effects),
+            masks=self.masks[:n],
+            next_state=self.next_state[:n],
+            expanded=self.expanded[:n],
+        )
+
+    @classmethod
+    def load(cls, path, product_list=None):
+        with np.load(path) as data:
+            table = cls(product_list, int(data["max_effects"]), capacity=max(1024, len(data["masks"])))
+            if list(data["products"]) != [p.name for p in table.products]:
+                raise ValueError(f"{path} was built for a different product list")
+            if "fingerprint" not in data or str(data["fingerprint"]) != rules_fingerprint(table.products):
+                raise ValueError(f"{path} was built for different rules")
+            masks = data["masks"]
+            n = len(masks)
+            table.masks[:n] = masks
+            table.next_state[:n] = data["next_state"]
+            table.expanded[:n] = data["expanded"]
+        table.size = n
+        table.state_of = {m: i for i, m in enumerate(masks.tolist())}
+        table.multiplier[:n] = [compute_multiplier(m) for m in masks.tolist()]
+        table.effect_count[:n] = [m.bit_count() for m in masks.tolist()]
+        return table
+
+_default_table = None
+
+def get_transition_table(path=None):
+    """
+    Shared table over rules.products, loaded from `path` when it exists and was
+    built for the current products and rules; otherwise a fresh table.
+    """
+    global _default_table
+    if _default_table is None:
+        if path and os.path.exists(path):
+            try:
+                _default_table = TransitionTable.load(path)
+            except ValueError:
+                _default_table = TransitionTable()
+        else:
+            _default_table = TransitionTable()
+    return _default_table
@@ -1,5 +1,9 @@
-from jinja2 import Template
-from config import OUTPUT_HTML_FILE
+import os
+import json
+import hashlib
+from config import OUTPUT_HTML_FILE, OUTPUT_DATA_DIR
+
+MANIFEST_FILE = "manifest.json"
 
 html_template = """
 <!DOCTYPE html>
@@ -33,14 +37,16 @@ html_template = """
   </div>
 
   <script>
-    const precomputedData = {{ precomputed|tojson }};
     const availableLevels = {{ levels|tojson }};
     const baseProductNames = {{ base_products|tojson }};
+    const manifestUrl = {{ manifest_url|tojson }};
     
     const baseSelect = document.getElementById("baseSelect");
     const levelSelect = document.getElementById("levelSelect");
     const resultsSection = document.getElementById("resultsSection");
     const resultsContent = document.getElementById("resultsContent");
+    let manifest = null;
+    const shards = {};
     
     baseProductNames.forEach(base => {
       const opt = document.createElement("option");
@@ -49,11 +55,19 @@ html_template = """
       baseSelect.appendChild(opt);
     });
     
+    function shardUrl(base, level) {
+      if (!manifest || !manifest.index[base]) {
+        return undefined;
+      }
+      const shard = manifest.index[base][manifest.levels.indexOf(level)];
+      return shard >= 0 ? manifest.shards[shard] : undefined;
+    }
+    
     function updateLevels() {
       const selectedBase = baseSelect.value;
       levelSelect.innerHTML = "";
       availableLevels.forEach(level => {
-        if (precomputedData[selectedBase] && precomputedData[selectedBase][level]) {
+        if (shardUrl(selectedBase, level)) {
           const opt = document.createElement("option");
           opt.value = level;
           opt.innerText = level;
@@ -62,19 +76,33 @@ html_template = """
       });
     }
     
+    function showMessage(message) {
+      resultsContent.innerHTML = `<p>${message}</p>`;
+      resultsSection.classList.remove("hidden");
+    }
+    
     baseSelect.addEventListener("change", updateLevels);
-    updateLevels();
+    fetch(manifestUrl)
+      .then(response => response.json())
+      .then(data => { manifest = data; updateLevels(); })
+      .catch(() => showMessage("Could not load the results index."));
     
     document.getElementById("viewButton").addEventListener("click", function() {
-      const selectedBase = baseSelect.value;
-      const selectedLevel = levelSelect.value;
-      if (!precomputedData[selectedBase] || !precomputedData[selectedBase][selectedLevel]) {
-        resultsContent.innerHTML = "<p>No data available for this selection.</p>";
-        resultsSection.classList.remove("hidden");
+      const url = shardUrl(baseSelect.value, levelSelect.value);
+      if (!url) {
+        showMessage("No data available for this selection.");
         return;
       }
-      
-      const result = precomputedData[selectedBase][selectedLevel];
+      if (!shards[url]) {
+        shards[url] = fetch(url).then(response => response.json());
+      }
+      shards[url].then(renderResult).catch(() => {
+        delete shards[url];
+        showMessage("Could not load results for this selection.");
+      });
+    });
+    
+    function renderResult(result) {
       let html = "";
       const lengths = Object.keys(result.by_length).map(x => parseInt(x)).sort((a, b) => a - b);
       html += "<table>";
@@ -100,17 +128,84 @@ html_template = """
       html += "</tbody></table>";
       resultsContent.innerHTML = html;
       resultsSection.classList.remove("hidden");
-    });
+    }
   </script>
 </body>
 </html>
 """
 
-def generate_static_html(precomputed, levels, base_products):
+def write_shards(precomputed, levels, data_dir=OUTPUT_DATA_DIR, fingerprint=None):
+    """
+    Write each distinct result once as data_dir/<content hash>.json, so all the
+    levels sharing a (base, bitmap) share one shard, plus a manifest listing the
+    shard URLs and, per base, the shard index of each level (-1 if none), and the
+    page fingerprint if given. Shards already on disk are kept as they are, and
+    shards no longer referenced are removed. Returns the manifest's URL relative
+    to the page.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    manifest = {"levels": levels, "shards": [], "index": {}}
+    if fingerprint is not None:
+        manifest["fingerprint"] = fingerprint
+    shard_index = {}
+    for base, by_level in precomputed.items():
+        manifest["index"][base] = []
+        for level in levels:
+            if level not in by_level:
+                manifest["index"][base].append(-1)
+                continue
+            data = json.dumps(by_level[level], sort_keys=True, separators=(",", ":"))
+            name = hashlib.sha256(data.encode()).hexdigest()[:16] + ".json"
+            if name not in shard_index:
+                path = os.path.join(data_dir, name)
+                if not os.path.exists(path):
+                    with open(path, "w", encoding="utf-8") as f:
+                        f.write(data)
+                shard_index[name] = len(manifest["shards"])
+                manifest["shards"].append(f"{data_dir}/{name}")
+            manifest["index"][base].append(shard_index[name])
+    for name in os.listdir(data_dir):
+        if name.endswith(".json") and name != MANIFEST_FILE and name not in shard_index:
+            os.remove(os.path.join(data_dir, name))
+    with open(os.path.join(data_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    return f"{data_dir}/{MANIFEST_FILE}"
+
+def page_fingerprint(fingerprint, levels, base_products):
+    """Hash of everything the page and its shards are generated from, given the results' grid_fingerprint."""
+    data = [fingerprint, levels, base_products, html_template]
+    return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+def page_is_current(fingerprint, levels, base_products, data_dir=OUTPUT_DATA_DIR):
+    """
+    True if the page, its manifest and every shard it lists are on disk and were
+    generated from the same inputs, so generate_static_html would rewrite them
+    unchanged.
+    """
+    if not os.path.exists(OUTPUT_HTML_FILE):
+        return False
+    try:
+        with open(os.path.join(data_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("fingerprint") != page_fingerprint(fingerprint, levels, base_products):
+        return False
+    return all(os.path.exists(url) for url in manifest["shards"])
+
+def generate_static_html(precomputed, levels, base_products, fingerprint=None):
+    """
+    Write the shards, the manifest and the page. With the results' fingerprint,
+    the manifest records the page fingerprint that page_is_current checks.
+    """
+    from jinja2 import Template
+    if fingerprint is not None:
+        fingerprint = page_fingerprint(fingerprint, levels, base_products)
+    manifest_url = write_shards(precomputed, levels, fingerprint=fingerprint)
     template = Template(html_template)
-    rendered_html = template.render(precomputed=precomputed,
-                                    levels=levels,
-                                    base_products=base_products)
+    rendered_html = template.render(levels=levels,
+                                    base_products=base_products,
+                                    manifest_url=manifest_url)
     with open(OUTPUT_HTML_FILE, "w", encoding="utf-8") as f:
         f.write(rendered_html)
     print(f"Static HTML file generated: {OUTPUT_HTML_FILE}")